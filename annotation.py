@@ -0,0 +1,117 @@
+"""Lazily rendered annotations.
+
+An Annotation is a base frame, which is never modified, plus a list of
+vector draw operations in that frame's pixel coordinates. Nothing is drawn
+until an image is asked for: render() copies the base once (or resizes it
+for a preview) and replays the operations onto that single buffer. Callers
+that only want the JSON never pay for copies or color conversions.
+
+The operations are plain tuples of ints, strings and floats, so they can
+be stored as JSON next to the base frame (see result_cache).
+"""
+import cv2
+import numpy as np
+from PIL import Image
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def _pt(point):
+    return int(point[0]), int(point[1])
+
+
+def _color(color):
+    return tuple(int(c) for c in color)
+
+
+def _scaled(point, scale):
+    return int(round(point[0] * scale)), int(round(point[1] * scale))
+
+
+def _thickness(thickness, scale):
+    # Negative thickness means filled
+    return thickness if thickness < 0 else max(1, int(round(thickness * scale)))
+
+
+def _draw_rectangle(canvas, scale, pt1, pt2, color, thickness):
+    cv2.rectangle(canvas, _scaled(pt1, scale), _scaled(pt2, scale), tuple(color), _thickness(thickness, scale))
+
+
+def _draw_line(canvas, scale, pt1, pt2, color, thickness):
+    cv2.line(canvas, _scaled(pt1, scale), _scaled(pt2, scale), tuple(color), _thickness(thickness, scale))
+
+
+def _draw_circle(canvas, scale, center, radius, color, thickness):
+    cv2.circle(canvas, _scaled(center, scale), max(1, int(round(radius * scale))), tuple(color),
+               _thickness(thickness, scale))
+
+
+def _draw_text(canvas, scale, text, org, font_scale, color, thickness, line_type):
+    cv2.putText(canvas, text, _scaled(org, scale), FONT, font_scale * scale, tuple(color),
+                _thickness(thickness, scale), line_type)
+
+
+_DRAW = {
+    "rectangle": _draw_rectangle,
+    "line": _draw_line,
+    "circle": _draw_circle,
+    "text": _draw_text,
+}
+
+
+class Annotation:
+    def __init__(self, base, ops=None):
+        self.base = base
+        self.ops = [tuple(op) for op in ops or ()]
+
+    @property
+    def shape(self):
+        return self.base.shape
+
+    @property
+    def nbytes(self):
+        return self.base.nbytes
+
+    def copy(self):
+        """A new annotation over the same base; drawing on it leaves this one unchanged."""
+        return Annotation(self.base, self.ops)
+
+    def rectangle(self, pt1, pt2, color, thickness=1):
+        self.ops.append(("rectangle", _pt(pt1), _pt(pt2), _color(color), int(thickness)))
+        return self
+
+    def line(self, pt1, pt2, color, thickness=1):
+        self.ops.append(("line", _pt(pt1), _pt(pt2), _color(color), int(thickness)))
+        return self
+
+    def circle(self, center, radius, color, thickness=1):
+        self.ops.append(("circle", _pt(center), int(radius), _color(color), int(thickness)))
+        return self
+
+    def text(self, text, org, font_scale, color, thickness=1, line_type=cv2.LINE_8):
+        self.ops.append(("text", str(text), _pt(org), float(font_scale), _color(color), int(thickness),
+                         int(line_type)))
+        return self
+
+    def render(self, max_side=None):
+        """BGR image with every operation drawn, at most `max_side` pixels on the long side."""
+        h, w = self.base.shape[:2]
+        scale = 1.0
+        if max_side and max(h, w) > max_side:
+            scale = max_side / max(h, w)
+            canvas = cv2.resize(self.base, (max(1, round(w * scale)), max(1, round(h * scale))),
+                                interpolation=cv2.INTER_AREA)
+        else:
+            canvas = np.array(self.base, copy=True)
+        for op in self.ops:
+            _DRAW[op[0]](canvas, scale, *op[1:])
+        return canvas
+
+    def to_pil(self, max_side=None):
+        return Image.fromarray(cv2.cvtColor(self.render(max_side), cv2.COLOR_BGR2RGB))
+
+    def to_jpeg(self, quality=85, max_side=None):
+        ok, buf = cv2.imencode(".jpg", self.render(max_side), [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+        return buf.tobytes()
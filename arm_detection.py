@@ -1,20 +1,73 @@
+import logging
+from collections import namedtuple
+from enum import IntEnum
 import cv2
-import mediapipe as mp
 import numpy as np
+from annotation import Annotation
 from image_handler import save_intermediate_image
-mp_pose = mp.solutions.pose
+from metrics import metrics
+from pose_pool import get_pose_pool
+logger = logging.getLogger(__name__)
+
+
+class PoseLandmark(IntEnum):
+    """MediaPipe Pose landmark indices used here (mirrors mp.solutions.pose.PoseLandmark
+    so importing this module does not pull in mediapipe)."""
+    LEFT_SHOULDER = 11
+    RIGHT_SHOULDER = 12
+    LEFT_ELBOW = 13
+    RIGHT_ELBOW = 14
+    LEFT_WRIST = 15
+    RIGHT_WRIST = 16
+
+# Armrest search geometry, relative to the upper arm (shoulder-elbow) length so
+# the search behaves the same whatever the image resolution.
+ROI_WIDTH_FACTOR = 1.5        # ROI width around the elbow
+ROI_BELOW_FACTOR = 0.75       # depth of the ROI below the elbow
+ROI_ABOVE_FACTOR = 0.5        # share of the shoulder-elbow height searched above the elbow
+ROI_MIN_PX = 32
+MIN_LINE_FACTOR = 0.5         # Hough minLineLength
+# Minimum edge length (cv2.arcLength, px) of a contour kept for the Hough mask. A thin edge's
+# contour traces both sides of it, so anything that can hold a Hough line (MIN_LINE_FACTOR)
+# measures about twice that; this only drops short specks of texture.
+MIN_CONTOUR_FACTOR = 0.15
+
+# Every tunable of the armrest search, so evaluate.py can sweep them.
+ArmrestParams = namedtuple("ArmrestParams", [
+    "blur_ksize",           # Gaussian blur kernel before Canny (odd)
+    "canny_low",
+    "canny_high",
+    "min_contour_factor",
+    "min_line_factor",
+    "hough_threshold",      # accumulator votes, capped at the minimum line length
+    "max_line_gap",
+    "max_slope",            # |dy/dx| below which a segment counts as horizontal
+    "roi_width_factor",
+    "roi_below_factor",
+    "roi_above_factor",
+])
+DEFAULT_ARMREST_PARAMS = ArmrestParams(
+    blur_ksize=7, canny_low=50, canny_high=150, min_contour_factor=MIN_CONTOUR_FACTOR,
+    min_line_factor=MIN_LINE_FACTOR, hough_threshold=30, max_line_gap=10, max_slope=0.5,
+    roi_width_factor=ROI_WIDTH_FACTOR, roi_below_factor=ROI_BELOW_FACTOR, roi_above_factor=ROI_ABOVE_FACTOR,
+)
+
+# Pose on the YOLO person box: padding on each side, relative to the box size,
+# so arms reaching past the box edge are still in the crop.
+PERSON_CROP_PAD = 0.15
+PERSON_CROP_MIN_PX = 64
 
 def detect_arm_side(results):
     """Determine if the visible arm is left or right based on average visibility of shoulder, elbow, and wrist."""
     # Get landmarks for left side
-    left_shoulder = results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_SHOULDER]
-    left_elbow = results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_ELBOW]
-    left_wrist = results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_WRIST]
+    left_shoulder = results.pose_landmarks.landmark[PoseLandmark.LEFT_SHOULDER]
+    left_elbow = results.pose_landmarks.landmark[PoseLandmark.LEFT_ELBOW]
+    left_wrist = results.pose_landmarks.landmark[PoseLandmark.LEFT_WRIST]
 
     # Get landmarks for right side
-    right_shoulder = results.pose_landmarks.landmark[mp_pose.PoseLandmark.RIGHT_SHOULDER]
-    right_elbow = results.pose_landmarks.landmark[mp_pose.PoseLandmark.RIGHT_ELBOW]
-    right_wrist = results.pose_landmarks.landmark[mp_pose.PoseLandmark.RIGHT_WRIST]
+    right_shoulder = results.pose_landmarks.landmark[PoseLandmark.RIGHT_SHOULDER]
+    right_elbow = results.pose_landmarks.landmark[PoseLandmark.RIGHT_ELBOW]
+    right_wrist = results.pose_landmarks.landmark[PoseLandmark.RIGHT_WRIST]
 
     # Extract visibility values
     left_visibilities = [
@@ -32,13 +85,8 @@ def detect_arm_side(results):
     left_avg_visibility = sum(left_visibilities) / len(left_visibilities)
     right_avg_visibility = sum(right_visibilities) / len(right_visibilities)
 
-    # Print all three visibility values for left and right
-    print(f"Left Shoulder Visibility: {left_shoulder.visibility:.3f}")
-    print(f"Left Elbow Visibility:    {left_elbow.visibility:.3f}")
-    print(f"Left Wrist Visibility:    {left_wrist.visibility:.3f}")
-    print(f"Right Shoulder Visibility: {right_shoulder.visibility:.3f}")
-    print(f"Right Elbow Visibility:    {right_elbow.visibility:.3f}")
-    print(f"Right Wrist Visibility:    {right_wrist.visibility:.3f}")
+    logger.debug("visibility left shoulder/elbow/wrist %.3f/%.3f/%.3f, right %.3f/%.3f/%.3f",
+                 *left_visibilities, *right_visibilities)
 
     # Decide side based on higher average visibility
     if right_avg_visibility > left_avg_visibility:
@@ -47,135 +95,225 @@ def detect_arm_side(results):
         return 'left'
 
     
-def detect_arm_landmarks(image, side='right'):
-    with mp_pose.Pose(static_image_mode=True) as pose:
-        results = pose.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-        if not results.pose_landmarks:
-            return None
-        landmarks = results.pose_landmarks.landmark
-        h, w, _ = image.shape
-        side = detect_arm_side(results)
-        print( "side detected: ", side)
-        if side == 'right': 
-            shoulder = landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER]
-            elbow = landmarks[mp_pose.PoseLandmark.RIGHT_ELBOW]
-            wrist = landmarks[mp_pose.PoseLandmark.RIGHT_WRIST]
-        else:
-            shoulder = landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER]
-            elbow = landmarks[mp_pose.PoseLandmark.LEFT_ELBOW]
-            wrist = landmarks[mp_pose.PoseLandmark.LEFT_WRIST]
-
-        return {
-            "shoulder": {"x": int(shoulder.x * w), "y": int(shoulder.y * h)},
-            "elbow": {"x": int(elbow.x * w), "y": int(elbow.y * h)},
-            "wrist": {"x": int(wrist.x * w), "y": int(wrist.y * h)}
-        }
-
-def crop_below_point(image, start_x, start_y, crop_width, crop_height, base_name=None, suffix=None):
-    h, w = image.shape[:2]
+def person_crop_bounds(person_box, image_shape, pad=PERSON_CROP_PAD):
+    """Padded (x1, y1, x2, y2) crop around an xyxy person box, clipped to the image."""
+    h, w = image_shape[:2]
+    x1, y1, x2, y2 = person_box
+    pad_x, pad_y = (x2 - x1) * pad, (y2 - y1) * pad
+    return (max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y)),
+            min(w, int(np.ceil(x2 + pad_x))), min(h, int(np.ceil(y2 + pad_y))))
+
+def detect_arm_landmarks(image, side='right', pool=None, person_box=None):
+    """Shoulder/elbow/wrist pixel coordinates of the more visible arm, or None.
+
+    `pool` is anything with a `process(rgb)` method: a PosePool (default: the
+    process-wide one) or a single Pose instance, e.g. a tracking-mode one.
+    With `person_box` (xyxy from the precheck) pose only sees a padded crop
+    around that person; landmarks are still returned in `image` coordinates.
+    """
+    pool = pool or get_pose_pool()
+    offset_x = offset_y = 0
+    if person_box is not None:
+        x1, y1, x2, y2 = person_crop_bounds(person_box, image.shape)
+        if x2 - x1 >= PERSON_CROP_MIN_PX and y2 - y1 >= PERSON_CROP_MIN_PX:
+            image = image[y1:y2, x1:x2]
+            offset_x, offset_y = x1, y1
+    with metrics.span("pose"):
+        results = pool.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    if not results.pose_landmarks:
+        metrics.incr("no_landmarks")
+        return None
+    landmarks = results.pose_landmarks.landmark
+    h, w, _ = image.shape
+    side = detect_arm_side(results)
+    logger.debug("side detected: %s", side)
+    if side == 'right': 
+        shoulder = landmarks[PoseLandmark.RIGHT_SHOULDER]
+        elbow = landmarks[PoseLandmark.RIGHT_ELBOW]
+        wrist = landmarks[PoseLandmark.RIGHT_WRIST]
+    else:
+        shoulder = landmarks[PoseLandmark.LEFT_SHOULDER]
+        elbow = landmarks[PoseLandmark.LEFT_ELBOW]
+        wrist = landmarks[PoseLandmark.LEFT_WRIST]
+
+    return {
+        "shoulder": {"x": int(shoulder.x * w) + offset_x, "y": int(shoulder.y * h) + offset_y},
+        "elbow": {"x": int(elbow.x * w) + offset_x, "y": int(elbow.y * h) + offset_y},
+        "wrist": {"x": int(wrist.x * w) + offset_x, "y": int(wrist.y * h) + offset_y}
+    }
+
+def roi_bounds(image_shape, start_x, start_y, crop_width, crop_height):
+    """Clip an ROI centred horizontally on start_x, starting at start_y, to the image."""
+    h, w = image_shape[:2]
     x1 = max(start_x - crop_width // 2, 0)
-    y1 = start_y
+    y1 = min(max(start_y, 0), h)
     x2 = min(x1 + crop_width, w)
     y2 = min(y1 + crop_height, h)
-    cropped = image[y1:y2, x1:x2]
-    if base_name is not None and suffix is not None:
-        save_intermediate_image(cropped, base_name, suffix)
-    return image[y1:y2, x1:x2], x1, y1
+    return x1, y1, x2, y2
+
+def find_armrest_candidates(image, rois, min_contour_len, min_line_length, base_name=None, artifacts=None,
+                            params=DEFAULT_ARMREST_PARAMS):
+    """Find near-horizontal edge segments (armrest candidates) inside each ROI.
+
+    `rois` is a list of (center_x, top_y, width, height). Grayscale conversion,
+    blur and Canny run once over the union of all ROIs; contour filtering and
+    Hough run per ROI, and the Hough segments are scored with array operations.
+    Debug images are only drawn when `artifacts` is recording.
+    """
+    debug = artifacts is not None and artifacts.enabled
+    # Empty (fully clipped) ROIs are dropped together with their box, so debug tags stay matched
+    pairs = [(roi, roi_bounds(image.shape, *roi)) for roi in rois]
+    pairs = [(roi, b) for roi, b in pairs if b[2] > b[0] and b[3] > b[1]]
+    if not pairs:
+        return []
+    boxes = [b for _, b in pairs]
+    ux1 = min(b[0] for b in boxes)
+    uy1 = min(b[1] for b in boxes)
+    ux2 = max(b[2] for b in boxes)
+    uy2 = max(b[3] for b in boxes)
+    with metrics.span("roi_edges"):
+        gray = cv2.cvtColor(image[uy1:uy2, ux1:ux2], cv2.COLOR_BGR2GRAY)
+        ksize = params.blur_ksize
+        blurred = cv2.GaussianBlur(gray, (ksize, ksize), 0) if ksize > 1 else gray
+        edges = cv2.Canny(blurred, params.canny_low, params.canny_high)
+
+    candidates = []
+    for (center_x, top_y, _, _), (x1, y1, x2, y2) in pairs:
+        roi_edges = edges[y1 - uy1:y2 - uy1, x1 - ux1:x2 - ux1]
+        with metrics.span("hough"):
+            contours, _ = cv2.findContours(roi_edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            mask = np.zeros_like(roi_edges)
+            cv2.drawContours(mask, [cnt for cnt in contours if cv2.arcLength(cnt, False) > min_contour_len], -1, 255, thickness=2)
+            lines = cv2.HoughLinesP(mask, rho=1, theta=np.pi/180,
+                                    threshold=min(params.hough_threshold, min_line_length),
+                                    minLineLength=min_line_length, maxLineGap=params.max_line_gap)
+
+        keep = None
+        if lines is not None:
+            segs = lines[:, 0].astype(np.int32)
+            dx = segs[:, 2] - segs[:, 0]
+            dy = segs[:, 3] - segs[:, 1]
+            # Near-horizontal only: |slope| < max_slope, vertical segments excluded
+            keep = (dx != 0) & (np.abs(dy) < params.max_slope * np.abs(dx))
+            kept = segs[keep]
+            lengths = np.hypot(dx[keep], dy[keep])
+            xs = x1 + np.minimum(kept[:, 0], kept[:, 2])
+            ys = y1 + (kept[:, 1] + kept[:, 3]) // 2 - 5
+            widths = np.abs(dx[keep])
+            for x, y, w, score in zip(xs.tolist(), ys.tolist(), widths.tolist(), lengths.tolist()):
+                candidates.append({"x": x, "y": y, "w": w, "h": 20, "score": score})
 
-def detect_armrest_and_annotate(image, landmarks, base_name, isDesk=False):
+        if debug:
+            tag = f"{center_x}_{top_y}"
+            save_intermediate_image(image[y1:y2, x1:x2], base_name, f"cropped_{tag}", artifacts)
+            save_intermediate_image(roi_edges, base_name, f"candidate_canny_{tag}", artifacts)
+            save_intermediate_image(mask, base_name, f"candidate_mask_{tag}", artifacts)
+            line_img = 255 * np.ones_like(mask)
+            if lines is not None:
+                for (lx1, ly1, lx2, ly2), is_candidate in zip(lines[:, 0], keep):
+                    cv2.line(line_img, (lx1, ly1), (lx2, ly2), 0 if is_candidate else 200, 2 if is_candidate else 1)
+            save_intermediate_image(line_img, base_name, f"candidates_{tag}", artifacts)
+    return candidates
+
+def search_armrest(image, landmarks, base_name=None, artifacts=None, params=DEFAULT_ARMREST_PARAMS):
+    """Best armrest candidate in the ROIs above and below the elbow, or None."""
     elbow = landmarks["elbow"]
-    wrist = landmarks["wrist"]
     shoulder = landmarks["shoulder"]
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
-def detect_armrest_and_annotate(image, landmarks, base_name, isDesk=False, isChair=True):
+    upper_arm = np.hypot(shoulder["x"] - elbow["x"], shoulder["y"] - elbow["y"])
+    min_line_length = max(20, int(upper_arm * params.min_line_factor))
+    min_contour_len = max(10, int(upper_arm * params.min_contour_factor))
+
+    roi_w = max(ROI_MIN_PX, int(upper_arm * params.roi_width_factor))
+    # Search below elbow, in case the armrest is below the elbow
+    below_roi_height = max(ROI_MIN_PX, int(upper_arm * params.roi_below_factor))
+    # Search above elbow (Assumption - from elbow up towards shoulder as the armrest will not be above the shoulder)
+    above_roi_height = max(ROI_MIN_PX, int(abs(shoulder["y"] - elbow["y"]) * params.roi_above_factor))
+    above_roi_top = max(0, elbow["y"] - above_roi_height)
+    rois = [
+        (elbow["x"], elbow["y"], roi_w, below_roi_height),
+        (elbow["x"], above_roi_top, roi_w, elbow["y"] - above_roi_top),
+    ]
+
+    # Vote: the longest near-horizontal segment across both ROIs wins
+    all_candidates = find_armrest_candidates(image, rois, min_contour_len, min_line_length, base_name, artifacts,
+                                             params)
+    best_candidate = max(all_candidates, key=lambda c: c["score"], default=None)
+    logger.debug("landmarks %s, best armrest candidate %s", landmarks, best_candidate)
+    if not best_candidate:
+        metrics.incr("no_armrest_candidate")
+    return best_candidate
+
+def armrest_line_strength(gray, box, band):
+    """Strongest horizontal edge row within +-band of an armrest box's line; returns (row, strength).
+
+    A cheap check that a known armrest line is still where it was, instead of
+    re-running the Canny/Hough search.
+    """
+    h, w = gray.shape
+    line_y = box["y"] + 5
+    y1, y2 = max(0, line_y - band), min(h, line_y + band + 1)
+    x1, x2 = max(0, box["x"]), min(w, box["x"] + box["w"])
+    if y2 - y1 < 3 or x2 - x1 < 2:
+        return line_y, 0.0
+    strip = gray[y1:y2, x1:x2].astype(np.int16)
+    profile = np.abs(np.diff(strip, axis=0)).mean(axis=1)
+    row = int(np.argmax(profile))
+    return y1 + row, float(profile[row])
+
+def desk_band(landmarks, image_shape):
+    """Estimated desk surface (x, y, w, h): a forearm-fifth below the wrist, to the right edge."""
     elbow = landmarks["elbow"]
     wrist = landmarks["wrist"]
-    shoulder = landmarks["shoulder"]
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-    def detect_in_roi(center_x, center_y, crop_w, crop_h):
-        cropped_edges, crop_x1, crop_y1 = crop_below_point(image, center_x, center_y, crop_w, crop_h,
-                                                            base_name, f"cropped_{center_x}_{center_y}")
-        edges = cv2.Canny(gray, 50, 150, apertureSize=3)
-        blurred = cv2.GaussianBlur(cropped_edges, (7, 7), 0)
-        edges_canny = cv2.Canny(blurred, 50, 150)
-        contours, _ = cv2.findContours(edges_canny.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        save_intermediate_image(edges_canny, base_name, f"candidate_canny_{center_x}_{center_y}")
-        filtered_contours = [cnt for cnt in contours if len(cnt) > 30]
-        mask = np.zeros_like(edges_canny)
-        cv2.drawContours(mask, filtered_contours, -1, 255, thickness=2)
-        save_intermediate_image(mask, base_name, f"candidate_mask_{center_x}_{center_y}")
-        lines = cv2.HoughLinesP(mask, rho=1, theta=np.pi/180, threshold=30, minLineLength=100, maxLineGap=10)
-        candidates = []
-        line_img = 255 * np.ones_like(mask)  
-        if lines is not None:
-            for x1, y1, x2, y2 in lines[:, 0]:
-                cv2.line(line_img, (x1, y1), (x2, y2), (200, 200, 200), 1)  
-                slope = (y2 - y1) / (x2 - x1) if (x2 - x1) != 0 else 9999
-                if -0.5 < slope < 0.5:  
-                    length = np.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-                    avg_y = (y1 + y2) / 2
-                    candidates.append({
-                        "x": crop_x1 + x1,
-                        "y": crop_y1 + int(avg_y) - 5,
-                        "w": x2 - x1,
-                        "h": 20,
-                        "score": length  
-                    })
-                    cv2.line(line_img, (x1, y1), (x2, y2), 0, 2)
-        # Construct suffix with center coordinates
-        suffix = f"candidates_{center_x}_{center_y}"
-        save_intermediate_image(line_img, base_name, suffix)
-        return candidates
-    annotated = image.copy()
-    # Draw arm landmarks
-    for joint, coord in landmarks.items():
-        cv2.circle(annotated, (coord["x"], coord["y"]), 8, (0, 255, 0), -1)
-        cv2.putText(annotated, joint, (coord["x"] + 5, coord["y"] - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-    best_candidate = {}
+    dx = wrist["x"] - elbow["x"]
+    dy = wrist["y"] - elbow["y"]
+    arm_length = int(np.sqrt(dx**2 + dy**2))
+    desk_offset = int(arm_length / 5)
+    desk_x = wrist["x"] - 50
+    desk_y = wrist["y"] + desk_offset
+    h, w = image_shape[:2]
+    desk_x = max(0, desk_x)
+    desk_w = w - desk_x
+    desk_h = 10
+    desk_y = min(desk_y, h - desk_h)
+    return desk_x, desk_y, desk_w, desk_h
 
-    if isChair:    
-        # Search below elbow, in case the armrest is below the elbow
-        below_candidates = detect_in_roi(elbow["x"], elbow["y"], 300, 150)
+def detect_armrest_and_annotate(image, landmarks, base_name, isDesk=False, isChair=True, artifacts=None,
+                                annotation=None, armrest_box=None, search=True):
+    """Search `image` for the armrest and add landmarks, armrest and desk band to an annotation.
 
-        # Search above elbow (Assumption - from elbow up towards shoulder as the armrest will not be above the shoulder)
-        above_roi_height = max(50, int(abs(shoulder["y"] - elbow["y"])/2))
-        above_candidates = detect_in_roi(elbow["x"], elbow["y"] - above_roi_height, 300, above_roi_height)
+    Draws onto a copy of `annotation` (default: a fresh one over `image`);
+    returns (annotation, best_candidate, desk_y). With search=False the
+    search is skipped and `armrest_box` (e.g. from the scene cache, possibly
+    empty) is used as is.
+    """
+    wrist = landmarks["wrist"]
 
-        # Combine & vote (above_candidates and below candidates are two dict with score and the maximum is selected)
-        all_candidates = below_candidates + above_candidates
-        best_candidate = max(all_candidates, key=lambda c: c["score"], default=None)
+    with metrics.span("annotation"):
+        annotated = annotation.copy() if annotation is not None else Annotation(image)
+        # Draw arm landmarks
+        for joint, coord in landmarks.items():
+            annotated.circle((coord["x"], coord["y"]), 8, (0, 255, 0), -1)
+            annotated.text(joint, (coord["x"] + 5, coord["y"] - 5), 0.6, (0, 255, 0), 2)
+    best_candidate = {}
 
-        
-    
-        print("details", landmarks)
-        print("best candidate", best_candidate)
+    if isChair:
+        if search:
+            best_candidate = search_armrest(image, landmarks, base_name, artifacts)
+        else:
+            best_candidate = armrest_box or {}
         # Draw best armrest box
         if best_candidate:
-            cv2.rectangle(annotated,
-                      (best_candidate["x"], best_candidate["y"]),
-                      (best_candidate["x"] + best_candidate["w"], best_candidate["y"] + best_candidate["h"]),
-                      (200, 180, 0), 4)
-            cv2.putText(annotated, "Armrest", (best_candidate["x"], best_candidate["y"] - 10),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 100, 0), 3)
+            annotated.rectangle((best_candidate["x"], best_candidate["y"]),
+                                (best_candidate["x"] + best_candidate["w"], best_candidate["y"] + best_candidate["h"]),
+                                (200, 180, 0), 4)
+            annotated.text("Armrest", (best_candidate["x"], best_candidate["y"] - 10), 0.7, (255, 100, 0), 3)
 
     desk_y = -1
     # Desk annotation (unchanged)
     if isDesk and wrist:
-        dx = wrist["x"] - elbow["x"]
-        dy = wrist["y"] - elbow["y"]
-        arm_length = int(np.sqrt(dx**2 + dy**2))
-        desk_offset = int(arm_length / 5)
-        desk_x = wrist["x"] - 50
-        desk_y = wrist["y"] + desk_offset
-        h, w, _ = image.shape
-        desk_x = max(0, desk_x)
-        desk_w = w - desk_x
-        desk_h = 10
-        desk_y = min(desk_y, h - desk_h)
-        cv2.rectangle(annotated, (desk_x, desk_y), (desk_x + desk_w, desk_y + desk_h), (100, 100, 255), 4)
-        cv2.putText(annotated, "Desk Height Annotation", (desk_x + 5, desk_y - 5),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (100, 100, 255), 2)
+        desk_x, desk_y, desk_w, desk_h = desk_band(landmarks, image.shape)
+        annotated.rectangle((desk_x, desk_y), (desk_x + desk_w, desk_y + desk_h), (100, 100, 255), 4)
+        annotated.text("Desk Height Annotation", (desk_x + 5, desk_y - 5), 0.8, (100, 100, 255), 2)
 
     return annotated, best_candidate, desk_y
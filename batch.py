@@ -0,0 +1,373 @@
+"""Headless batch runner for the armrest pipeline.
+
+Fans `process_image_flow` + `classify_armrest_height` out over a pool of
+worker processes and appends one result row per image to a JSONL or CSV file.
+
+    python batch.py photos/ --out results.jsonl --workers 8
+    python batch.py "audits/**/*.jpg" --out results.csv --max-rss-mb 2048
+
+Re-running with the same --out resumes: images already processed successfully
+are skipped, and images that failed (including those lost to a crashed worker)
+are retried; their new row is appended after the error row.
+"""
+import argparse
+import collections
+import csv
+import glob
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+import traceback
+
+from metrics import json_default
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+# Workers dying this many times in a row before taking any image abort the run
+MAX_STARTUP_FAILURES = 3
+
+CSV_FIELDS = [
+    "file", "status", "classification",
+    "isPerson", "isChair", "isDesk", "isSitting", "isStanding", "arm_landmarks_detected",
+    "shoulder_x", "shoulder_y", "elbow_x", "elbow_y", "wrist_x", "wrist_y",
+    "armrest_x", "armrest_y", "armrest_w", "armrest_h", "desk_y",
+    "elapsed_ms", "error",
+]
+
+
+def collect_images(inputs):
+    """Expand directories (recursively) and glob patterns into a sorted list of image paths."""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                for name in files:
+                    if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                        paths.add(os.path.join(root, name))
+        else:
+            for match in glob.glob(item, recursive=True):
+                if os.path.isfile(match) and os.path.splitext(match)[1].lower() in IMAGE_EXTENSIONS:
+                    paths.add(match)
+    return sorted(paths)
+
+
+def load_done(out_path):
+    """Return the set of files already processed successfully in out_path (for resume)."""
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, newline="") as f:
+        if out_path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                if row.get("status") == "ok":
+                    done.add(row["file"])
+        else:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                    if row.get("status") == "ok":
+                        done.add(row["file"])
+                except (ValueError, KeyError, AttributeError):
+                    # A partially written last line from a crash; that image is redone.
+                    continue
+    return done
+
+
+def flatten_row(row):
+    flat = {k: row.get(k) for k in CSV_FIELDS if k in row}
+    for joint, coords in (row.get("landmarks") or {}).items():
+        flat[f"{joint}_x"] = coords["x"]
+        flat[f"{joint}_y"] = coords["y"]
+    for key, value in (row.get("armrest_box") or {}).items():
+        if key in ("x", "y", "w", "h"):
+            flat[f"armrest_{key}"] = value
+    return flat
+
+
+class ResultWriter:
+    def __init__(self, out_path):
+        self.is_csv = out_path.endswith(".csv")
+        new_file = not os.path.exists(out_path) or os.path.getsize(out_path) == 0
+        self.f = open(out_path, "a", newline="")
+        if self.is_csv:
+            self.writer = csv.DictWriter(self.f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            if new_file:
+                self.writer.writeheader()
+
+    def write(self, row):
+        if self.is_csv:
+            self.writer.writerow(flatten_row(row))
+        else:
+            self.f.write(json.dumps(row, default=json_default) + "\n")
+        # Flush every row so a crash loses at most the images in flight.
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss is the peak, in KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def request_id_for(path):
+    # Unique per input path so same-named files in different folders don't collide.
+    return os.path.normpath(path).strip(os.sep).replace(os.sep, "__")
+
+
+def _init_worker(save_artifacts_dir):
+    # Intermediate images are only wanted when explicitly asked for.
+    from image_handler import configure_artifact_store
+    if save_artifacts_dir:
+        configure_artifact_store("disk", out_dir=save_artifacts_dir)
+    else:
+        configure_artifact_store("off")
+    # Load the YOLO model once for the lifetime of the worker; a single warmed
+    # Pose instance is reused for every image the worker handles.
+    import flow  # noqa: F401
+    import models
+    from pose_pool import configure_pose_pool
+    configure_pose_pool(size=1)
+    models.warmup()
+
+
+def process_path(path, decoded=None):
+    """Run one image; `decoded` is an optional future already decoding it."""
+    from flow import process_image_flow
+    from classify import classify_armrest_height
+    from image_handler import decode_file
+
+    start = time.perf_counter()
+    try:
+        image = decoded.result() if decoded is not None else decode_file(path)
+        # Batch inputs are distinct files, so the result cache would only cost memory.
+        _, result_json = process_image_flow(image, os.path.basename(path), request_id=request_id_for(path),
+                                            use_cache=False)
+        row = {
+            "file": path,
+            "status": "ok",
+            "classification": classify_armrest_height(result_json),
+            **result_json,
+        }
+    except Exception as e:
+        row = {"file": path, "status": "error", "error": f"{type(e).__name__}: {e}"}
+    row["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return row
+
+
+class WorkerStartupError(RuntimeError):
+    """Workers cannot start (e.g. a model or dependency fails to load); retrying would not help."""
+
+
+def _worker_main(task_queue, result_queue, save_artifacts_dir, max_rss_mb):
+    try:
+        _init_worker(save_artifacts_dir)
+    except Exception:
+        result_queue.put(("init_error", os.getpid(), traceback.format_exc()))
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    from image_handler import decode_file, get_artifact_store
+    pid = os.getpid()
+    # The next image is decoded on this thread while the current one runs inference.
+    decoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="decode")
+    taken = collections.deque()
+    exiting = False
+
+    def take(block):
+        try:
+            path = task_queue.get(block=block)
+        except queue.Empty:
+            return
+        if path is None:
+            return True
+        # Reported when taken, so the parent can account for it if we die.
+        result_queue.put(("start", pid, path))
+        taken.append((path, decoder.submit(decode_file, path)))
+
+    while True:
+        if not taken and not exiting:
+            exiting = take(block=True)
+        if not taken:
+            decoder.shutdown()
+            get_artifact_store().close()
+            result_queue.put(("exit", pid, None))
+            return
+        path, decoded = taken.popleft()
+        if not taken and not exiting:
+            exiting = take(block=False)
+        result_queue.put(("result", pid, process_path(path, decoded)))
+        # Artifacts are only needed until they have been written out.
+        get_artifact_store().flush()
+        get_artifact_store().discard(request_id_for(path))
+        if not exiting and max_rss_mb and current_rss_mb() > max_rss_mb:
+            # Retire after the image already taken and let the parent start a
+            # fresh worker in our place.
+            for path, decoded in taken:
+                result_queue.put(("result", pid, process_path(path, decoded)))
+                get_artifact_store().flush()
+                get_artifact_store().discard(request_id_for(path))
+            decoder.shutdown()
+            get_artifact_store().close()
+            result_queue.put(("recycle", pid, None))
+            return
+
+
+def run_batch(paths, out_path, workers=None, max_rss_mb=None, save_artifacts_dir=None, progress=True):
+    """Process `paths` on `workers` processes, appending rows to `out_path`.
+
+    Returns (processed, failed) counts for this run. Raises WorkerStartupError
+    when workers cannot start.
+    """
+    workers = workers or os.cpu_count() or 1
+    done = load_done(out_path)
+    todo = [p for p in paths if p not in done]
+    if progress:
+        print(f"{len(paths)} images, {len(paths) - len(todo)} already done, {len(todo)} to process", file=sys.stderr)
+    if not todo:
+        return 0, 0
+
+    ctx = mp.get_context("spawn")
+    task_queue = ctx.Queue()
+    result_queue = ctx.Queue()
+    procs = {}
+    in_flight = {}
+
+    def spawn():
+        p = ctx.Process(target=_worker_main, args=(task_queue, result_queue, save_artifacts_dir, max_rss_mb),
+                        daemon=True)
+        p.start()
+        procs[p.pid] = p
+
+    writer = ResultWriter(out_path)
+    pending = iter(todo)
+    outstanding = 0
+    processed = failed = 0
+    started_pids = set()
+    startup_failures = 0
+    aborted = False
+    start = time.perf_counter()
+
+    def feed():
+        nonlocal outstanding
+        # Keep a small backlog per worker so nobody idles between tasks.
+        while outstanding < 2 * workers:
+            path = next(pending, None)
+            if path is None:
+                return
+            task_queue.put(path)
+            outstanding += 1
+
+    try:
+        for _ in range(min(workers, len(todo))):
+            spawn()
+        feed()
+        while outstanding:
+            try:
+                kind, pid, payload = result_queue.get(timeout=1.0)
+            except queue.Empty:
+                # Detect workers that died mid-image (segfault, OOM kill).
+                for pid, p in list(procs.items()):
+                    if not p.is_alive():
+                        del procs[pid]
+                        if pid not in started_pids:
+                            startup_failures += 1
+                            if startup_failures >= MAX_STARTUP_FAILURES:
+                                aborted = True
+                                raise WorkerStartupError(f"{startup_failures} workers exited before taking an "
+                                                         f"image (last exit code {p.exitcode})")
+                        # Paths are processed in the order taken: the first one was running, the
+                        # rest were only prefetched and go back on the queue.
+                        lost = in_flight.pop(pid, [])
+                        for path in lost[:1]:
+                            writer.write({"file": path, "status": "error",
+                                          "error": f"worker exited with code {p.exitcode}"})
+                            outstanding -= 1
+                            failed += 1
+                        for path in lost[1:]:
+                            task_queue.put(path)
+                        spawn()
+                feed()
+                continue
+
+            if kind == "init_error":
+                aborted = True
+                raise WorkerStartupError(f"worker failed to start:\n{payload}")
+            if kind == "start":
+                started_pids.add(pid)
+                startup_failures = 0
+                in_flight.setdefault(pid, []).append(payload)
+            elif kind == "result":
+                if payload["file"] in in_flight.get(pid, []):
+                    in_flight[pid].remove(payload["file"])
+                writer.write(payload)
+                outstanding -= 1
+                processed += 1
+                if payload["status"] != "ok":
+                    failed += 1
+                if progress and processed % 50 == 0:
+                    rate = processed / (time.perf_counter() - start)
+                    print(f"{processed}/{len(todo)} done ({rate:.1f} img/s)", file=sys.stderr)
+                feed()
+            elif kind == "recycle":
+                procs.pop(pid).join()
+                spawn()
+    finally:
+        if aborted:
+            for p in procs.values():
+                p.terminate()
+        for _ in procs:
+            task_queue.put(None)
+        for p in procs.values():
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+        writer.close()
+
+    if progress:
+        elapsed = time.perf_counter() - start
+        print(f"processed {processed} images ({failed} failed) in {elapsed:.1f}s "
+              f"({processed / elapsed:.1f} img/s)", file=sys.stderr)
+    return processed, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the armrest classifier over many images.")
+    parser.add_argument("inputs", nargs="+", help="image directories or glob patterns")
+    parser.add_argument("--out", required=True, help="output file (.jsonl or .csv); appended to for resume")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--max-rss-mb", type=float, default=None,
+                        help="recycle a worker once its resident memory exceeds this many MB")
+    parser.add_argument("--save-artifacts", metavar="DIR", default=None,
+                        help="write intermediate images to DIR/<image name>/ (off by default)")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    paths = collect_images(args.inputs)
+    if not paths:
+        parser.error("no images found")
+    try:
+        _, failed = run_batch(paths, args.out, workers=args.workers,
+                              max_rss_mb=args.max_rss_mb, save_artifacts_dir=args.save_artifacts,
+                              progress=not args.quiet)
+    except WorkerStartupError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+"""Reproducible benchmarks for every pipeline stage.
+
+Times JPEG decoding, run_precheck, detect_arm_landmarks, detect_armrest_and_annotate,
+classify_armrest_height and the full process_image_flow on synthetic
+side-profile scenes at several resolutions, and reports p50/p95 latency,
+images/sec and the peak resident memory seen while each stage ran.
+
+    python benchmark.py                                  # print a report
+    python benchmark.py --save-baseline bench_baseline.json
+    python benchmark.py --baseline bench_baseline.json --tolerance 0.25
+
+With --baseline the run exits non-zero when any stage's p50 latency is more
+than `tolerance` slower than the stored baseline.
+
+When the YOLO weights are not on disk (or with --models stand-in) a
+deterministic local stand-in detector is used so the rest of the pipeline can
+still be measured; --models stand-in also replaces the MediaPipe pose graph.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+
+RESOLUTIONS = {
+    "vga": (640, 480),
+    "hd": (1280, 960),
+    "12mp": (4032, 3024),
+}
+
+# Normalized scene geometry shared by the scene generator and the stand-in models.
+SCENE = {
+    "shoulder": (0.45, 0.35),
+    "elbow": (0.47, 0.55),
+    "wrist": (0.65, 0.57),
+    "armrest_y": 0.58,
+    "armrest_x": (0.35, 0.62),
+    "desk_y": 0.62,
+    "person_box": (0.30, 0.15, 0.70, 0.95),
+    "chair_box": (0.25, 0.45, 0.65, 0.98),
+    "desk_box": (0.60, 0.60, 1.00, 0.98),
+}
+
+
+def make_scene(width, height, seed=0):
+    """Synthetic side-profile workstation: person, chair with a horizontal armrest edge, desk."""
+    import cv2
+    rng = np.random.default_rng(seed)
+    # Vertical gradient wall plus sensor-like noise so Canny has texture to reject
+    gradient = np.linspace(170, 220, height, dtype=np.float32)[:, None, None]
+    img = np.broadcast_to(gradient, (height, width, 3)).copy()
+    img += rng.normal(0, 6, size=img.shape).astype(np.float32)
+    img = np.clip(img, 0, 255).astype(np.uint8)
+
+    def px(pt):
+        return int(pt[0] * width), int(pt[1] * height)
+
+    t = max(2, width // 200)
+    # Desk
+    dx1, dy1, dx2, dy2 = SCENE["desk_box"]
+    cv2.rectangle(img, px((dx1, SCENE["desk_y"])), px((dx2, SCENE["desk_y"] + 0.03)), (60, 90, 140), -1)
+    cv2.rectangle(img, px((dx1 + 0.05, SCENE["desk_y"])), px((dx1 + 0.07, dy2)), (60, 90, 140), -1)
+    # Chair seat, back and the armrest as a long horizontal bar
+    cx1, cy1, cx2, cy2 = SCENE["chair_box"]
+    cv2.rectangle(img, px((cx1, 0.72)), px((cx2, 0.76)), (40, 40, 40), -1)
+    cv2.rectangle(img, px((cx1, cy1)), px((cx1 + 0.03, 0.76)), (40, 40, 40), -1)
+    ax1, ax2 = SCENE["armrest_x"]
+    cv2.rectangle(img, px((ax1, SCENE["armrest_y"])), px((ax2, SCENE["armrest_y"] + 0.02)), (30, 30, 30), -1)
+    # Person: head, torso, arm, legs
+    shoulder, elbow, wrist = px(SCENE["shoulder"]), px(SCENE["elbow"]), px(SCENE["wrist"])
+    cv2.circle(img, px((0.46, 0.24)), int(0.06 * height), (120, 150, 200), -1)
+    cv2.line(img, shoulder, px((0.44, 0.72)), (90, 60, 50), 3 * t)
+    cv2.line(img, shoulder, elbow, (120, 150, 200), 2 * t)
+    cv2.line(img, elbow, wrist, (120, 150, 200), 2 * t)
+    cv2.line(img, px((0.44, 0.72)), px((0.62, 0.74)), (50, 50, 90), 3 * t)
+    cv2.line(img, px((0.62, 0.74)), px((0.62, 0.95)), (50, 50, 90), 3 * t)
+    return img
+
+
+def scene_landmarks(width, height):
+    return {name: {"x": int(SCENE[name][0] * width), "y": int(SCENE[name][1] * height)}
+            for name in ("shoulder", "elbow", "wrist")}
+
+
+# --- stand-in models -------------------------------------------------------
+
+class StandInDetector:
+    """A detectors backend that needs no weights.
+
+    It performs the same letterbox resize as the real model so preprocessing
+    cost scales with the input, then reports the scene's person, chair and
+    desk boxes.
+    """
+    name = "stand-in"
+    thread_safe = True
+    names = {0: "person", 56: "chair", 63: "laptop"}
+
+    def predict(self, frames, imgsz, conf):
+        import cv2
+        from detectors import Detections
+        results = []
+        for frame in frames:
+            h, w = frame.shape[:2]
+            ratio = imgsz / max(h, w)
+            cv2.resize(frame, (max(1, int(w * ratio)), max(1, int(h * ratio))), interpolation=cv2.INTER_LINEAR)
+            xyxy = [(x1 * w, y1 * h, x2 * w, y2 * h) for x1, y1, x2, y2 in
+                    (SCENE[key] for key in ("person_box", "chair_box", "desk_box"))]
+            results.append(Detections(np.array(xyxy, dtype=np.float32), np.full(3, 0.9, dtype=np.float32),
+                                      np.array([0, 56, 63], dtype=np.int64)))
+        return results
+
+
+class _StandInLandmark:
+    def __init__(self, x, y, visibility):
+        self.x, self.y, self.visibility = x, y, visibility
+
+
+def person_crop():
+    """Normalized bounds of the padded person crop pose runs on (see arm_detection.person_crop_bounds)."""
+    from arm_detection import PERSON_CROP_PAD
+    x1, y1, x2, y2 = SCENE["person_box"]
+    pad_x, pad_y = (x2 - x1) * PERSON_CROP_PAD, (y2 - y1) * PERSON_CROP_PAD
+    return max(0.0, x1 - pad_x), max(0.0, y1 - pad_y), min(1.0, x2 + pad_x), min(1.0, y2 + pad_y)
+
+
+class StandInPose:
+    """Mimics mp.solutions.pose.Pose: the right arm of the synthetic scene is visible.
+
+    Like the pipeline, it expects the padded crop around the scene's person
+    box, so the landmarks are returned normalized to that crop.
+    """
+
+    def __init__(self):
+        self.crop = person_crop()
+
+    def process(self, rgb_image):
+        cx1, cy1, cx2, cy2 = self.crop
+        landmarks = [_StandInLandmark(0.5, 0.5, 0.1) for _ in range(33)]
+        # Right shoulder/elbow/wrist are landmarks 12/14/16 in MediaPipe Pose
+        for idx, name in ((12, "shoulder"), (14, "elbow"), (16, "wrist")):
+            x, y = SCENE[name]
+            landmarks[idx] = _StandInLandmark((x - cx1) / (cx2 - cx1), (y - cy1) / (cy2 - cy1), 0.95)
+        return types.SimpleNamespace(pose_landmarks=types.SimpleNamespace(landmark=landmarks))
+
+    def close(self):
+        pass
+
+
+def install_stand_in_detector():
+    import models
+    models.register("yolo", StandInDetector)
+
+
+# --- measurement -----------------------------------------------------------
+
+class RssSampler:
+    """Polls this process's RSS in the background and keeps the maximum."""
+
+    def __init__(self, interval=0.005):
+        from batch import current_rss_mb
+        self._read = current_rss_mb
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, self._read())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_mb = self._read()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, self._read())
+
+
+def time_stage(fn, iterations, warmup):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    with RssSampler() as rss:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+    samples = np.array(samples)
+    return {
+        "p50_ms": float(np.percentile(samples, 50) * 1000),
+        "p95_ms": float(np.percentile(samples, 95) * 1000),
+        "images_per_s": float(len(samples) / samples.sum()),
+        "peak_rss_mb": round(rss.peak_mb, 1),
+        "iterations": len(samples),
+    }
+
+
+def run_benchmarks(resolutions, iterations, warmup, stages=None):
+    import io
+    from PIL import Image
+    from env_analysis import run_precheck
+    from image_handler import decode_image
+    from arm_detection import detect_arm_landmarks, detect_armrest_and_annotate
+    from classify import classify_armrest_height
+    from flow import process_image_flow
+
+    results = {}
+    for res_name in resolutions:
+        width, height = RESOLUTIONS[res_name]
+        frame = make_scene(width, height)
+        pil_image = Image.fromarray(frame[:, :, ::-1].copy())
+        buf = io.BytesIO()
+        pil_image.save(buf, format="JPEG", quality=90)
+        jpeg = buf.getvalue()
+        landmarks = scene_landmarks(width, height)
+        px1, py1, px2, py2 = SCENE["person_box"]
+        person = (px1 * width, py1 * height, px2 * width, py2 * height)
+        classify_input = {
+            "isChair": True, "isDesk": True, "isPerson": True, "isSitting": True, "isStanding": False,
+            "arm_landmarks_detected": True, "landmarks": landmarks,
+            "armrest_box": {"x": 0, "y": int(SCENE["armrest_y"] * height), "w": 100, "h": 20},
+            "desk_y": int(SCENE["desk_y"] * height),
+        }
+        cases = {
+            "decode_pil": lambda: np.asarray(Image.open(io.BytesIO(jpeg)).convert("RGB")),
+            "decode_image": lambda: decode_image(jpeg),
+            "run_precheck": lambda: run_precheck(frame),
+            # On the person crop, as in process_image_flow
+            "detect_arm_landmarks": lambda: detect_arm_landmarks(frame, person_box=person),
+            "detect_armrest_and_annotate": lambda: detect_armrest_and_annotate(frame, landmarks, "bench.png",
+                                                                               isDesk=True, isChair=True),
+            "classify_armrest_height": lambda: classify_armrest_height(classify_input),
+            "process_image_flow": lambda: process_image_flow(pil_image, "bench.png", use_cache=False),
+        }
+        for stage, fn in cases.items():
+            if stages and stage not in stages:
+                continue
+            key = f"{stage}@{res_name}"
+            results[key] = time_stage(fn, iterations, warmup)
+            print(f"{key:45s} p50 {results[key]['p50_ms']:9.2f} ms  p95 {results[key]['p95_ms']:9.2f} ms  "
+                  f"{results[key]['images_per_s']:8.1f} img/s  peak {results[key]['peak_rss_mb']:7.1f} MB",
+                  file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of human-readable regressions against `baseline`."""
+    regressions = []
+    for key, base in baseline["results"].items():
+        current = results.get(key)
+        if current is None:
+            continue
+        limit = base["p50_ms"] * (1 + tolerance)
+        if current["p50_ms"] > limit:
+            regressions.append(f"{key}: p50 {current['p50_ms']:.2f} ms > {limit:.2f} ms "
+                               f"(baseline {base['p50_ms']:.2f} ms + {tolerance:.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the armrest pipeline stages.")
+    parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument("--stages", nargs="+", default=None, help="only run these stages")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--models", choices=("auto", "real", "stand-in"), default="auto",
+                        help="auto: real models, stand-in detector when the detector weights are missing")
+    parser.add_argument("--artifacts", choices=("off", "memory", "disk"), default="off")
+    parser.add_argument("--out", help="write the results as JSON")
+    parser.add_argument("--save-baseline", metavar="PATH", help="store these results as the baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="fail on regressions against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    from detectors import DETECTOR_BACKEND, backend_weights
+    stand_in_detector = args.models == "stand-in" or (
+        args.models == "auto" and not os.path.exists(backend_weights(DETECTOR_BACKEND)))
+    if stand_in_detector:
+        install_stand_in_detector()
+
+    import models
+    from image_handler import configure_artifact_store
+    from pose_pool import configure_pose_pool
+    configure_artifact_store(args.artifacts)
+    if args.models == "stand-in":
+        configure_pose_pool(size=1, factory=StandInPose)
+    # Keep model loading out of the first timed iterations
+    models.warmup()
+
+    model_info = {"detector": "stand-in" if stand_in_detector else DETECTOR_BACKEND,
+                  "pose": "stand-in" if args.models == "stand-in" else "mediapipe"}
+    print(f"models: {model_info}", file=sys.stderr)
+    results = run_benchmarks(args.resolutions, args.iterations, args.warmup, args.stages)
+    report = {"models": model_info, "results": results}
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline saved to {args.save_baseline}", file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("models") != model_info:
+            print(f"warning: baseline was recorded with models {baseline.get('models')}", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("performance regressions:", file=sys.stderr)
+            for line in regressions:
+                print("  " + line, file=sys.stderr)
+            return 1
+        print("no regressions", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
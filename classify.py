@@ -1,4 +1,20 @@
-def classify_armrest_height(data):
+import logging
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Tolerance around the resting elbow height, as a fraction of it
+ALLOWED_MARGIN = 0.1
+
+
+def classify_armrest_height(data, margin=ALLOWED_MARGIN):
+    with metrics.span("classification"):
+        result = _classify_armrest_height(data, margin)
+    metrics.incr("classification_" + result.lower().replace(" ", "_"))
+    return result
+
+
+def _classify_armrest_height(data, margin=ALLOWED_MARGIN):
     """
     Classifies armrest height as 'Optimal', 'Too High', or 'Too Low'.
     Handles:
@@ -6,7 +22,7 @@ def classify_armrest_height(data):
     Sitting with desk: compare armrest vs elbow and desk
     Sitting without desk: compare armrest vs elbow only
     """
-    print(data)
+    logger.debug("classifying %s", data)
 
     required_keys = ["isChair", "isDesk", "isPerson", "arm_landmarks_detected", "landmarks"]
     if not all(k in data for k in required_keys):
@@ -23,16 +39,16 @@ def classify_armrest_height(data):
     elbow_shoulder_dist = (dx**2 + dy**2) ** 0.5
     resting_elbow_y = shoulder["y"] + elbow_shoulder_dist * 1.1  # slight offset
 
-    allowed_margin = resting_elbow_y / 10  # 10% margin
+    allowed_margin = resting_elbow_y * margin
 
    
     # First case : Standing, no chair
-    print( "debug logs resting_elbow_y : ",resting_elbow_y, " , allowed_margin: " , allowed_margin)
+    logger.debug("resting_elbow_y: %s, allowed_margin: %s", resting_elbow_y, allowed_margin)
     if data.get("isStanding"):
         if "desk_y" not in data:
             return "Insufficient Data"
         desk_y = data["desk_y"]
-        print("desk_y ", desk_y)
+        logger.debug("desk_y: %s", desk_y)
         if desk_y < resting_elbow_y - allowed_margin:
             return "Too High"
         elif desk_y > resting_elbow_y + allowed_margin:
@@ -43,7 +59,8 @@ def classify_armrest_height(data):
    
     # Armrest height calculation
    
-    if not data.get("isChair") or "armrest_box" not in data:
+    # No armrest candidate found (None or {}) also means there is nothing to compare
+    if not data.get("isChair") or not data.get("armrest_box"):
         return "Insufficient Data"
     armrest_box = data["armrest_box"]
     armrest_top_y = float(armrest_box["y"])
@@ -55,7 +72,7 @@ def classify_armrest_height(data):
     
     if data.get("isDesk"):
         desk_y = data["desk_y"]
-        print("desk_y: ", desk_y)
+        logger.debug("desk_y: %s", desk_y)
         if armrest_avg_y > resting_elbow_y + allowed_margin or armrest_avg_y > desk_y + allowed_margin:
             return "Too Low"
         elif armrest_avg_y < resting_elbow_y - allowed_margin:
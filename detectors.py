@@ -0,0 +1,304 @@
+"""Pluggable object detector backends for the environment precheck.
+
+Every backend exposes `names` (class id -> label) and
+`predict(frames, imgsz, conf)`, which returns one Detections per frame.
+
+Backends:
+    ultralytics  - yolov8n.pt through ultralytics/torch (default)
+    onnx         - the same model exported to ONNX, run with ONNX Runtime
+    onnx-int8    - the ONNX model quantized to int8
+
+Select one with ARMREST_DETECTOR (and ARMREST_DETECTOR_THREADS for the ONNX
+Runtime thread count). Producing and checking the ONNX models:
+
+    python detectors.py export                      # yolov8n.pt -> yolov8n.onnx
+    python detectors.py quantize --calibration photos/
+    python detectors.py parity photos/ --backend onnx-int8
+"""
+import argparse
+import ast
+import os
+import sys
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+import models
+
+BACKENDS = ("ultralytics", "onnx", "onnx-int8")
+DETECTOR_BACKEND = os.environ.get("ARMREST_DETECTOR", "ultralytics")
+TORCH_WEIGHTS = "yolov8n.pt"
+ONNX_PATH = os.environ.get("ARMREST_ONNX_PATH", "yolov8n.onnx")
+ONNX_INT8_PATH = os.environ.get("ARMREST_ONNX_INT8_PATH", "yolov8n.int8.onnx")
+DETECTOR_THREADS = int(os.environ.get("ARMREST_DETECTOR_THREADS", "0"))  # 0 = runtime default
+NMS_IOU = 0.7    # ultralytics' predict default; every backend uses it so their boxes agree
+LETTERBOX_FILL = 114
+
+# Boxes as xyxy pixel coordinates in the input frame, with confidences and class ids.
+Detections = namedtuple("Detections", ["xyxy", "conf", "cls"])
+
+
+def _empty_detections():
+    return Detections(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64))
+
+
+class UltralyticsBackend:
+    name = "ultralytics"
+    thread_safe = False
+
+    def __init__(self, weights=TORCH_WEIGHTS):
+        YOLO = models.timed_import("ultralytics").YOLO
+        self.weights = weights
+        self.model = YOLO(weights)
+        self.names = self.model.names
+
+    def predict(self, frames, imgsz, conf):
+        results = self.model.predict(frames, imgsz=imgsz, conf=conf, iou=NMS_IOU, verbose=False)
+        out = []
+        for r in results:
+            boxes = r.boxes
+            out.append(Detections(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(),
+                                  boxes.cls.cpu().numpy().astype(np.int64)))
+        return out
+
+
+def letterbox(frame, imgsz):
+    """Resize keeping aspect ratio and pad to imgsz x imgsz, as ultralytics does."""
+    h, w = frame.shape[:2]
+    ratio = imgsz / max(h, w)
+    new_w, new_h = max(1, round(w * ratio)), max(1, round(h * ratio))
+    resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (imgsz - new_w) // 2, (imgsz - new_h) // 2
+    canvas = np.full((imgsz, imgsz, 3), LETTERBOX_FILL, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = resized
+    return canvas, ratio, pad_x, pad_y
+
+
+class OnnxBackend:
+    """YOLOv8 ONNX export run with ONNX Runtime on the CPU."""
+
+    thread_safe = True
+
+    def __init__(self, path=ONNX_PATH, threads=DETECTOR_THREADS, name="onnx"):
+        ort = models.timed_import("onnxruntime")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; create it with 'python detectors.py export'")
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.name = name
+        self.weights = path
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        # A static export only takes one image at a time
+        self.fixed_batch = inp.shape[0] if isinstance(inp.shape[0], int) else None
+        self.fixed_size = inp.shape[2] if isinstance(inp.shape[2], int) else None
+        meta = self.session.get_modelmeta().custom_metadata_map
+        if "names" not in meta:
+            raise ValueError(f"{path} has no class names in its metadata; export it with ultralytics")
+        self.names = {int(k): v for k, v in ast.literal_eval(meta["names"]).items()}
+
+    def predict(self, frames, imgsz, conf):
+        imgsz = self.fixed_size or imgsz
+        prepared = [letterbox(f, imgsz) for f in frames]
+        # BGR HWC uint8 -> RGB NCHW float32 in [0, 1]
+        batch = np.stack([p[0] for p in prepared])[..., ::-1].transpose(0, 3, 1, 2)
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+        if self.fixed_batch == 1 and len(frames) > 1:
+            outputs = np.concatenate([self.session.run(None, {self.input_name: batch[i:i + 1]})[0]
+                                      for i in range(len(frames))])
+        else:
+            outputs = self.session.run(None, {self.input_name: batch})[0]
+        return [self._postprocess(out, conf, *p[1:], frame.shape) for out, p, frame in
+                zip(outputs, prepared, frames)]
+
+    def _postprocess(self, output, conf, ratio, pad_x, pad_y, shape):
+        # output: (4 + num_classes, num_anchors) with boxes as cx, cy, w, h
+        preds = output.T
+        scores = preds[:, 4:]
+        cls = scores.argmax(axis=1)
+        best = scores[np.arange(len(cls)), cls]
+        keep = best >= conf
+        if not keep.any():
+            return _empty_detections()
+        boxes, best, cls = preds[keep, :4], best[keep], cls[keep]
+        xyxy = np.empty_like(boxes)
+        xyxy[:, 0] = boxes[:, 0] - boxes[:, 2] / 2
+        xyxy[:, 1] = boxes[:, 1] - boxes[:, 3] / 2
+        xyxy[:, 2] = boxes[:, 0] + boxes[:, 2] / 2
+        xyxy[:, 3] = boxes[:, 1] + boxes[:, 3] / 2
+        # Per-class NMS: offset each class into its own region so boxes of
+        # different classes never suppress each other.
+        offset = cls[:, None].astype(np.float32) * 4096
+        shifted = xyxy + offset
+        idx = cv2.dnn.NMSBoxes(
+            np.column_stack([shifted[:, :2], shifted[:, 2:] - shifted[:, :2]]).tolist(),
+            best.tolist(), conf, NMS_IOU)
+        idx = np.array(idx, dtype=np.int64).reshape(-1)
+        xyxy, best, cls = xyxy[idx], best[idx], cls[idx]
+        # Undo the letterbox
+        xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - pad_x) / ratio
+        xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - pad_y) / ratio
+        h, w = shape[:2]
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+        return Detections(xyxy.astype(np.float32), best.astype(np.float32), cls.astype(np.int64))
+
+
+def load_backend(name=None):
+    name = name or DETECTOR_BACKEND
+    if name == "ultralytics":
+        return UltralyticsBackend()
+    if name == "onnx":
+        return OnnxBackend(ONNX_PATH, name="onnx")
+    if name == "onnx-int8":
+        return OnnxBackend(ONNX_INT8_PATH, name="onnx-int8")
+    raise ValueError(f"unknown detector backend {name!r}; choose from {BACKENDS}")
+
+
+def backend_weights(name=None):
+    name = name or DETECTOR_BACKEND
+    return {"ultralytics": TORCH_WEIGHTS, "onnx": ONNX_PATH, "onnx-int8": ONNX_INT8_PATH}.get(name, name)
+
+
+def backend_fingerprint(name=None):
+    """Identifies the detector weights and NMS setting for result caching."""
+    name = name or DETECTOR_BACKEND
+    weights = backend_weights(name)
+    if os.path.exists(weights):
+        stat = os.stat(weights)
+        weights = f"{weights}:{stat.st_size}:{int(stat.st_mtime)}"
+    return f"{name}:{weights}:iou{NMS_IOU}"
+
+
+# --- export / quantize / parity ---------------------------------------------
+
+def export_onnx(out_path=ONNX_PATH, imgsz=None):
+    from env_analysis import IMG_SIZE
+    YOLO = models.timed_import("ultralytics").YOLO
+    exported = YOLO(TORCH_WEIGHTS).export(format="onnx", imgsz=imgsz or IMG_SIZE, dynamic=True, simplify=True)
+    if os.path.abspath(exported) != os.path.abspath(out_path):
+        os.replace(exported, out_path)
+    return out_path
+
+
+def _image_paths(inputs, limit=None):
+    from batch import collect_images
+    paths = collect_images(inputs)
+    return paths[:limit] if limit else paths
+
+
+class _CalibrationReader:
+    """Feeds letterboxed sample images to ONNX Runtime static quantization."""
+
+    def __init__(self, input_name, paths, imgsz):
+        self.input_name = input_name
+        self.paths = iter(paths)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        for path in self.paths:
+            frame = cv2.imread(path)
+            if frame is None:
+                continue
+            img = letterbox(frame, self.imgsz)[0][..., ::-1].transpose(2, 0, 1)[None]
+            return {self.input_name: np.ascontiguousarray(img, dtype=np.float32) / 255.0}
+        return None
+
+
+def quantize_onnx(src=ONNX_PATH, dst=ONNX_INT8_PATH, calibration=None, calibration_images=200):
+    """int8-quantize an ONNX model: static (QDQ) with calibration images, otherwise dynamic."""
+    from env_analysis import IMG_SIZE
+    ort = models.timed_import("onnxruntime")
+    quant = models.timed_import("onnxruntime.quantization")
+    if calibration:
+        paths = _image_paths(calibration, calibration_images)
+        if not paths:
+            raise ValueError("no calibration images found")
+        input_name = ort.InferenceSession(src, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+        quant.quantize_static(src, dst, _CalibrationReader(input_name, paths, IMG_SIZE),
+                              quant_format=quant.QuantFormat.QDQ, per_channel=True,
+                              activation_type=quant.QuantType.QUInt8, weight_type=quant.QuantType.QInt8)
+    else:
+        quant.quantize_dynamic(src, dst, weight_type=quant.QuantType.QUInt8)
+    return dst
+
+
+def parity(inputs, backend_name, reference_name="ultralytics", limit=None):
+    """Compare precheck labels of `backend_name` against the reference backend on sample images."""
+    from env_analysis import CONF_THRESHOLD, DRAW_CLASSES, IMG_SIZE, precheck_labels
+
+    reference = load_backend(reference_name)
+    candidate = load_backend(backend_name)
+    per_label = {label: {"reference": 0, "both": 0} for label in sorted(DRAW_CLASSES)}
+    agree = status_agree = images = 0
+    timings = {reference_name: 0.0, backend_name: 0.0}
+    for path in _image_paths(inputs, limit):
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        labels = {}
+        for name, backend in ((reference_name, reference), (backend_name, candidate)):
+            start = time.perf_counter()
+            detections = backend.predict([frame], IMG_SIZE, CONF_THRESHOLD)[0]
+            timings[name] += time.perf_counter() - start
+            labels[name] = precheck_labels(detections, backend.names)[0]
+        ref, cand = labels[reference_name], labels[backend_name]
+        images += 1
+        agree += ref == cand
+        status_agree += ("person" in ref) == ("person" in cand)
+        for label in ref:
+            if label in per_label:
+                per_label[label]["reference"] += 1
+                per_label[label]["both"] += label in cand
+    if not images:
+        raise ValueError("no readable images")
+    return {
+        "images": images,
+        "label_set_agreement": agree / images,
+        "person_agreement": status_agree / images,
+        "recall_vs_reference": {label: (v["both"] / v["reference"] if v["reference"] else None)
+                                for label, v in per_label.items()},
+        "mean_ms": {name: 1000 * t / images for name, t in timings.items()},
+    }
+
+
+def main(argv=None):
+    import json
+    parser = argparse.ArgumentParser(description="Export, quantize and check precheck detector backends.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export", help="export yolov8n.pt to ONNX")
+    p.add_argument("--out", default=ONNX_PATH)
+    p.add_argument("--imgsz", type=int, default=None)
+    p = sub.add_parser("quantize", help="int8-quantize the ONNX model")
+    p.add_argument("--src", default=ONNX_PATH)
+    p.add_argument("--out", default=ONNX_INT8_PATH)
+    p.add_argument("--calibration", nargs="+", default=None,
+                   help="image directories/globs for static quantization (dynamic if omitted)")
+    p = sub.add_parser("parity", help="label agreement of a backend against ultralytics")
+    p.add_argument("inputs", nargs="+", help="image directories or glob patterns")
+    p.add_argument("--backend", default="onnx-int8", choices=BACKENDS)
+    p.add_argument("--limit", type=int, default=None)
+    p.add_argument("--min-agreement", type=float, default=None,
+                   help="exit non-zero if label-set agreement is below this fraction")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        print(export_onnx(args.out, args.imgsz))
+    elif args.command == "quantize":
+        print(quantize_onnx(args.src, args.out, args.calibration))
+    else:
+        report = parity(args.inputs, args.backend, limit=args.limit)
+        print(json.dumps(report, indent=2))
+        if args.min_agreement is not None and report["label_set_agreement"] < args.min_agreement:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
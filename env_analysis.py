@@ -1,9 +1,16 @@
-import cv2
 import numpy as np
-from ultralytics import YOLO
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import nullcontext
+from metrics import metrics
+from annotation import Annotation
+import detectors
+import models
 
 # Constants
-MODEL_PATH = "yolov8n.pt"
+MODEL_PATH = detectors.TORCH_WEIGHTS
 IMG_SIZE = 320
 CONF_THRESHOLD = 0.4
 DRAW_CLASSES = {"person", "chair", "desk"}
@@ -12,24 +19,49 @@ BOX_COLOR = (170, 200, 0)
 HEADER_COLOR_PASS = (255, 40, 0)
 HEADER_COLOR_FAIL = (0, 0, 255)
 
-# Load model once
-model = YOLO(MODEL_PATH)
-CLASS_NAMES = model.names
 
-def run_precheck(frame):
-    results = model.predict(frame, imgsz=IMG_SIZE, conf=CONF_THRESHOLD, verbose=False)[0]
+def _load_model():
+    # Backend is chosen by ARMREST_DETECTOR: ultralytics (default), onnx or onnx-int8
+    model = detectors.load_backend()
+    # First predict initializes the predictor; do it here rather than on a request.
+    model.predict([np.zeros((IMG_SIZE, IMG_SIZE, 3), dtype=np.uint8)], IMG_SIZE, CONF_THRESHOLD)
+    return model
+
+# Loaded on first use (or by models.warmup()), not at import time
+models.register("yolo", _load_model, replace=False)
+
+def get_model():
+    return models.get("yolo")
+
+# Ultralytics predictors keep per-call state, so one predict at a time per model.
+# ONNX Runtime sessions can be run concurrently.
+_predict_lock = threading.Lock()
+
+# Request coalescing defaults for PrecheckBatcher
+BATCH_MAX_SIZE = 8
+BATCH_MAX_WAIT_MS = 10
+
+# Multi-person pairing: chairs/desks further than this many person-box
+# diagonals from the person are not paired with them.
+PAIR_MAX_DISTANCE = 1.0
+
+def precheck_labels(detections, names):
     detected_labels, filtered_boxes = set(), []
 
-    for box in results.boxes:
-        cls_id = int(box.cls[0])
-        label = CLASS_NAMES[cls_id]
+    for xyxy, conf, cls_id in zip(detections.xyxy, detections.conf, detections.cls):
+        label = names[int(cls_id)]
 
         if label in DESK_ALTERNATES:
             detected_labels.add("desk")
 
         if label in DRAW_CLASSES:
             detected_labels.add(label)
-            filtered_boxes.append((box.xyxy[0], label, box.conf[0]))
+            filtered_boxes.append((xyxy, label, float(conf)))
+
+    return detected_labels, filtered_boxes
+
+def parse_precheck(detections, names=None):
+    detected_labels, filtered_boxes = precheck_labels(detections, names or get_model().names)
 
     pass_conditions = [
         {"person"},
@@ -39,23 +71,159 @@ def run_precheck(frame):
     ]
     status = any(pc.issubset(detected_labels) for pc in pass_conditions)
     missing = None if status else DRAW_CLASSES - detected_labels
+    metrics.incr("precheck_pass" if status else "precheck_fail")
 
     return status, missing, filtered_boxes, detected_labels
 
+def detect_batch(frames):
+    """Raw detector output (detectors.Detections) for each frame, from one predict call."""
+    frames = list(frames)
+    if not frames:
+        return []
+    model = get_model()
+    lock = nullcontext() if getattr(model, "thread_safe", False) else _predict_lock
+    with lock, metrics.span("precheck"):
+        return model.predict(frames, IMG_SIZE, CONF_THRESHOLD)
+
+def run_precheck_batch(frames):
+    """Run the precheck on a list of frames with a single batched predict call."""
+    names = get_model().names
+    return [parse_precheck(r, names) for r in detect_batch(frames)]
+
+def run_precheck(frame):
+    return run_precheck_batch([frame])[0]
+
+class PrecheckBatcher:
+    """Coalesces run_precheck calls from concurrent threads into batched predicts.
+
+    Callers block in precheck() until their frame's result is ready. A batch is
+    flushed once it holds max_size frames or the oldest frame has waited
+    max_wait_ms, whichever comes first.
+    """
+
+    def __init__(self, max_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS):
+        self.max_size = max_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name="precheck-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame):
+        if self._closed:
+            raise RuntimeError("precheck batcher is closed")
+        future = Future()
+        self._queue.put((frame, future))
+        return future
+
+    def precheck(self, frame):
+        return self.submit(frame).result()
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._run(batch)
+                    return
+                batch.append(item)
+            self._run(batch)
+
+    def _run(self, batch):
+        frames = [frame for frame, _ in batch]
+        try:
+            results = run_precheck_batch(frames)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+def _center(xyxy):
+    return (xyxy[0] + xyxy[2]) / 2, (xyxy[1] + xyxy[3]) / 2
+
+def pair_workstations(detections, names):
+    """Group detections into one workstation per person, ordered left to right.
+
+    Each person gets the nearest chair (a chair serves one person; closest
+    pairs are assigned first) and the nearest desk or desk item (desks can
+    be shared). Anything further than PAIR_MAX_DISTANCE person-box diagonals
+    from the person's centre is not theirs. Returns dicts with "person",
+    "person_conf", "chair" and "desk"; boxes are xyxy tuples or None.
+    """
+    people, chairs, desks = [], [], []
+    for xyxy, conf, cls_id in zip(detections.xyxy, detections.conf, detections.cls):
+        label = names[int(cls_id)]
+        box = tuple(float(v) for v in xyxy)
+        if label == "person":
+            people.append((box, float(conf)))
+        elif label == "chair":
+            chairs.append(box)
+        elif label == "desk" or label in DESK_ALTERNATES:
+            desks.append(box)
+    people.sort(key=lambda p: p[0][0])
+
+    def distance(person, other):
+        (px, py), (ox, oy) = _center(person), _center(other)
+        return np.hypot(px - ox, py - oy)
+
+    def max_distance(person):
+        return PAIR_MAX_DISTANCE * np.hypot(person[2] - person[0], person[3] - person[1])
+
+    stations = [{"person": box, "person_conf": conf, "chair": None, "desk": None} for box, conf in people]
+    pairs = sorted((distance(st["person"], chair), i, j) for i, st in enumerate(stations)
+                   for j, chair in enumerate(chairs))
+    used_chairs = set()
+    for dist, i, j in pairs:
+        station = stations[i]
+        if station["chair"] is None and j not in used_chairs and dist <= max_distance(station["person"]):
+            station["chair"] = chairs[j]
+            used_chairs.add(j)
+    for station in stations:
+        nearest = min(desks, key=lambda d: distance(station["person"], d), default=None)
+        if nearest is not None and distance(station["person"], nearest) <= max_distance(station["person"]):
+            station["desk"] = nearest
+    return stations
+
+def workstation_labels(station):
+    """The precheck label set for a single workstation."""
+    labels = {"person"}
+    if station["chair"] is not None:
+        labels.add("chair")
+    if station["desk"] is not None:
+        labels.add("desk")
+    return labels
+
 def get_posture(detected_labels):
     if "person" not in detected_labels:
         return "Unknown"
     return "Sitting" if "chair" in detected_labels else "Standing"
 
-def draw_filtered_boxes(frame, boxes):
+def draw_filtered_boxes(annotation, boxes):
     for (coords, label, conf) in boxes:
         x1, y1, x2, y2 = map(int, coords)
-        cv2.rectangle(frame, (x1, y1), (x2, y2), BOX_COLOR, 2)
-        cv2.putText(frame, f"{label} {conf:.2f}", (x1, y1 - 10),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, BOX_COLOR, 2)
-    return frame
+        annotation.rectangle((x1, y1), (x2, y2), BOX_COLOR, 2)
+        annotation.text(f"{label} {conf:.2f}", (x1, y1 - 10), 0.6, BOX_COLOR, 2)
+    return annotation
 
-def add_header_info(frame, detected_labels, status, missing):
+def add_header_info(annotation, detected_labels, status, missing):
     posture = get_posture(detected_labels)
     if status:
         detected_str = ", ".join(sorted(detected_labels))
@@ -65,9 +233,8 @@ def add_header_info(frame, detected_labels, status, missing):
         header_text = f"Missing: {', '.join(missing)}"
         color = HEADER_COLOR_FAIL
 
-    cv2.putText(frame, header_text, (20, 30),
-                cv2.FONT_HERSHEY_SIMPLEX, 1, color, 2)
-    return frame, posture
+    annotation.text(header_text, (20, 30), 1, color, 2)
+    return annotation, posture
 
 def build_json(detected_labels, posture):
     result = {
@@ -81,10 +248,32 @@ def build_json(detected_labels, posture):
         result["isDesk"] = True
     return result
 
-def analyze_environment(frame, base_name):
-    frame_copy = frame.copy()
-    status, missing, filtered_boxes, detected_labels = run_precheck(frame_copy)
-    frame_copy = draw_filtered_boxes(frame_copy, filtered_boxes)
-    frame_copy, posture = add_header_info(frame_copy, detected_labels, status, missing)
+def annotate_environment(frame, precheck_result):
+    """Precheck boxes and header as an Annotation over `frame` (which is not drawn on), plus the json."""
+    status, missing, filtered_boxes, detected_labels = precheck_result
+    annotation = draw_filtered_boxes(Annotation(frame), filtered_boxes)
+    annotation, posture = add_header_info(annotation, detected_labels, status, missing)
     result_json = build_json(detected_labels, posture)
-    return frame_copy, result_json
+    return annotation, result_json
+
+def precheck_frame(frame, batcher=None):
+    if batcher is not None:
+        return batcher.precheck(frame)
+    return run_precheck(frame)
+
+def person_box(precheck_result):
+    """xyxy of the most confident person detection, or None."""
+    people = [(conf, coords) for coords, label, conf in precheck_result[2] if label == "person"]
+    if not people:
+        return None
+    return tuple(float(v) for v in max(people, key=lambda p: p[0])[1])
+
+def analyze_environment(frame, base_name, batcher=None):
+    precheck_result = precheck_frame(frame, batcher)
+    return annotate_environment(frame, precheck_result)
+
+def analyze_environment_batch(frames):
+    """Batched analyze_environment: one predict call for all frames."""
+    frames = list(frames)
+    precheck_results = run_precheck_batch(frames)
+    return [annotate_environment(f, r) for f, r in zip(frames, precheck_results)]
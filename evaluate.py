@@ -0,0 +1,275 @@
+"""Accuracy/latency sweep for the armrest search and classification settings.
+
+Takes a labeled image set: a CSV or JSONL file with "file" and "label"
+columns (--labels), or folders named after the label, e.g.
+photos/Optimal/*.jpg and "photos/Too High/*.jpg".
+
+The models run once per image. The decoded working frame, the precheck JSON
+and the arm landmarks are cached under --cache-dir, keyed by file content and
+the pipeline fingerprint. Every combination in the parameter grid then
+re-runs only the Canny/Hough armrest search and classify_armrest_height on
+those cached outputs, spread over all cores. Each worker warms up before
+timing, and each image's latency is the fastest of --repeats runs. The report lists accuracy and
+armrest-search latency per configuration, marks the accuracy/latency Pareto
+front, and flags configurations that are faster than the current defaults
+and at least as accurate.
+
+    python evaluate.py photos/ --labels labels.csv --out sweep.json
+    python evaluate.py photos/ --grid grid.json --workers 8
+
+A grid file maps ArmrestParams fields (and "margin", the classification
+tolerance) to lists of values to try.
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+LABELS = ("Optimal", "Too High", "Too Low", "Insufficient Data")
+
+DEFAULT_GRID = {
+    "blur_ksize": [5, 7],
+    "canny_low": [30, 50, 80],
+    "canny_high": [100, 150, 200],
+    "hough_threshold": [20, 30],
+    "max_slope": [0.3, 0.5],
+    "margin": [0.08, 0.1, 0.12],
+}
+
+
+def load_labels(inputs, labels_path=None):
+    """Return [(path, label)] from a labels file, or from label-named parent folders."""
+    from batch import collect_images
+    if labels_path:
+        with open(labels_path, newline="") as f:
+            if labels_path.endswith(".csv"):
+                rows = list(csv.DictReader(f))
+            else:
+                rows = [json.loads(line) for line in f if line.strip()]
+        base = os.path.dirname(labels_path)
+        samples = []
+        for row in rows:
+            path = row["file"] if os.path.isabs(row["file"]) else os.path.join(base, row["file"])
+            samples.append((path, row["label"]))
+    else:
+        samples = [(path, os.path.basename(os.path.dirname(path))) for path in collect_images(inputs)]
+    unknown = {label for _, label in samples if label not in LABELS}
+    if unknown:
+        raise ValueError(f"unknown labels {sorted(unknown)}; expected one of {LABELS}")
+    return samples
+
+
+# --- model outputs, computed once per image ----------------------------------
+
+def _cache_paths(cache_dir, path):
+    from flow import pipeline_fingerprint
+    h = hashlib.sha256(pipeline_fingerprint().encode())
+    with open(path, "rb") as f:
+        h.update(f.read())
+    base = os.path.join(cache_dir, h.hexdigest())
+    return base + ".json", base + ".npy"
+
+
+def extract_model_outputs(path):
+    """Run decode, precheck and pose exactly as process_image_flow does."""
+    from arm_detection import detect_arm_landmarks
+    from env_analysis import build_json, get_posture, person_box, run_precheck
+    from image_handler import decode_file
+
+    frame = decode_file(path).frame
+    precheck_result = run_precheck(frame)
+    detected_labels = precheck_result[3]
+    env_json = build_json(detected_labels, get_posture(detected_labels))
+    box = person_box(precheck_result)
+    landmarks = detect_arm_landmarks(frame, side='right', person_box=box) if box is not None else None
+    return frame, env_json, landmarks
+
+
+def cache_model_outputs(samples, cache_dir, progress=True):
+    """Make sure every sample has cached model outputs; returns [(frame_path, json_path, label)]."""
+    os.makedirs(cache_dir, exist_ok=True)
+    cached = []
+    computed = 0
+    for path, label in samples:
+        json_path, frame_path = _cache_paths(cache_dir, path)
+        if not os.path.exists(json_path):
+            try:
+                frame, env_json, landmarks = extract_model_outputs(path)
+            except ValueError as e:
+                print(f"skipping {path}: {e}", file=sys.stderr)
+                continue
+            np.save(frame_path, frame, allow_pickle=False)
+            tmp_path = json_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"file": path, "env": env_json, "landmarks": landmarks}, f)
+            os.replace(tmp_path, json_path)
+            computed += 1
+        cached.append((frame_path, json_path, label))
+    if progress:
+        print(f"{len(cached)} images, model outputs computed for {computed}", file=sys.stderr)
+    return cached
+
+
+# --- sweep -------------------------------------------------------------------
+
+_samples = None
+_repeats = 1
+
+
+def _init_sweep_worker(cached, repeats=1):
+    global _samples, _repeats
+    from arm_detection import DEFAULT_ARMREST_PARAMS
+    from classify import classify_armrest_height
+    _repeats = max(1, repeats)
+    _samples = []
+    for frame_path, json_path, label in cached:
+        with open(json_path) as f:
+            data = json.load(f)
+        # Memory-mapped, so all workers share one copy of the frames in the page cache
+        frame = np.load(frame_path, mmap_mode="r")
+        _samples.append((np.asarray(frame), data["env"], data["landmarks"], label))
+    # Pay for lazy imports and OpenCV setup here, not in the first configuration's timings
+    for frame, env_json, landmarks, _ in _samples:
+        if landmarks:
+            classify_armrest_height(armrest_result(frame, env_json, landmarks, DEFAULT_ARMREST_PARAMS))
+            break
+
+
+def armrest_result(frame, env_json, landmarks, params):
+    """The result json process_image_flow would produce, from cached model outputs."""
+    from arm_detection import desk_band, search_armrest
+    if not landmarks:
+        return {**env_json, "arm_landmarks_detected": False}
+    armrest_box = {}
+    if env_json.get("isChair", True):
+        armrest_box = search_armrest(frame, landmarks, params=params)
+    desk_y = desk_band(landmarks, frame.shape)[1] if env_json.get("isDesk", False) else -1
+    return {**env_json, "arm_landmarks_detected": True, "landmarks": landmarks, "armrest_box": armrest_box,
+            "desk_y": desk_y}
+
+
+def evaluate_config(config):
+    from arm_detection import DEFAULT_ARMREST_PARAMS
+    from classify import ALLOWED_MARGIN, classify_armrest_height
+
+    params = DEFAULT_ARMREST_PARAMS._replace(**{k: v for k, v in config.items() if k != "margin"})
+    margin = config.get("margin", ALLOWED_MARGIN)
+    confusion = {}
+    latencies = []
+    correct = 0
+    for frame, env_json, landmarks, label in _samples:
+        best = None
+        for _ in range(_repeats):
+            start = time.perf_counter()
+            result = armrest_result(frame, env_json, landmarks, params)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        latencies.append(best)
+        predicted = classify_armrest_height(result, margin)
+        correct += predicted == label
+        confusion.setdefault(label, {}).setdefault(predicted, 0)
+        confusion[label][predicted] += 1
+    latencies = np.array(latencies)
+    return {
+        "config": config,
+        "accuracy": correct / len(_samples) if _samples else 0.0,
+        "mean_ms": float(latencies.mean() * 1000) if len(latencies) else 0.0,
+        "p95_ms": float(np.percentile(latencies, 95) * 1000) if len(latencies) else 0.0,
+        "confusion": confusion,
+    }
+
+
+def expand_grid(grid):
+    from arm_detection import ArmrestParams
+    unknown = set(grid) - set(ArmrestParams._fields) - {"margin"}
+    if unknown:
+        raise ValueError(f"unknown grid parameters {sorted(unknown)}")
+    # cv2.GaussianBlur needs an odd kernel; 1 or less means no blur
+    even = [k for k in grid.get("blur_ksize", []) if not isinstance(k, int) or (k > 1 and k % 2 == 0)]
+    if even:
+        raise ValueError(f"blur_ksize values must be odd integers, got {even}")
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def pareto_front(results):
+    """Configs that no other config beats on both accuracy and mean latency."""
+    front = []
+    for r in sorted(results, key=lambda r: (r["mean_ms"], -r["accuracy"])):
+        if not front or r["accuracy"] > front[-1]["accuracy"]:
+            front.append(r)
+    return front
+
+
+def run_sweep(cached, configs, workers=None, repeats=1):
+    workers = workers or os.cpu_count() or 1
+    # Spawned, not forked: this process has model threads running
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_sweep_worker,
+                             initargs=(cached, repeats)) as pool:
+        return list(pool.map(evaluate_config, configs, chunksize=max(1, len(configs) // (workers * 4))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep armrest search / classification settings on labeled images.")
+    parser.add_argument("inputs", nargs="*", help="image directories or glob patterns (label = parent folder)")
+    parser.add_argument("--labels", help="CSV or JSONL with file,label columns instead of folder names")
+    parser.add_argument("--grid", help="JSON file mapping parameter names to lists of values")
+    parser.add_argument("--cache-dir", default=".eval_cache", help="where model outputs are cached")
+    parser.add_argument("--workers", type=int, default=None, help="sweep processes (default: CPU count)")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per image; the fastest counts")
+    parser.add_argument("--top", type=int, default=15, help="rows to print")
+    parser.add_argument("--out", help="write every configuration's results as JSON")
+    args = parser.parse_args(argv)
+    if not args.inputs and not args.labels:
+        parser.error("give image folders or --labels")
+
+    samples = load_labels(args.inputs, args.labels)
+    if not samples:
+        parser.error("no labeled images found")
+    import models
+    import flow  # noqa: F401  (registers the models)
+    models.warmup()
+    cached = cache_model_outputs(samples, args.cache_dir)
+
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid) as f:
+            grid = json.load(f)
+    configs = expand_grid(grid)
+    # Always include the current defaults as the reference point
+    configs.append({})
+    start = time.perf_counter()
+    results = run_sweep(cached, configs, args.workers, args.repeats)
+    print(f"{len(configs)} configurations in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    baseline = results[-1]
+    front = {id(r) for r in pareto_front(results)}
+    for r in results:
+        r["pareto"] = id(r) in front
+        r["beats_defaults"] = (r["accuracy"] >= baseline["accuracy"] and r["mean_ms"] < baseline["mean_ms"])
+    ranked = sorted(results, key=lambda r: (-r["accuracy"], r["mean_ms"]))
+
+    print(f"defaults: accuracy {baseline['accuracy']:.3f}, {baseline['mean_ms']:.2f} ms/image")
+    print(f"{'accuracy':>8s} {'mean ms':>8s} {'p95 ms':>8s}  flags    config")
+    for r in ranked[:args.top]:
+        flags = ("P" if r["pareto"] else " ") + ("+" if r["beats_defaults"] else " ")
+        print(f"{r['accuracy']:8.3f} {r['mean_ms']:8.2f} {r['p95_ms']:8.2f}  {flags:7s}  {r['config'] or 'defaults'}")
+    print("P = on the accuracy/latency Pareto front, + = faster than the defaults and at least as accurate")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"defaults": baseline, "results": ranked}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
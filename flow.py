@@ -1,62 +1,262 @@
 import cv2
 import numpy as np
-from PIL import Image
 import os
-from env_analysis import analyze_environment
+import copy
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import detectors
+import env_analysis
+from env_analysis import annotate_environment, person_box, precheck_frame
 from arm_detection import detect_arm_landmarks, detect_armrest_and_annotate
-from image_handler import save_intermediate_image
-from image_handler import  clean_intermediate_dir
+from image_handler import save_intermediate_image, get_artifact_store
+from image_handler import DecodedImage, WORKING_MAX_SIDE, to_working_resolution, scale_landmarks, scale_box
+from annotation import Annotation
+from stage_graph import InlineExecutor, StageGraph
+from metrics import metrics, Profiler, PROFILE_MODE
+from pose_pool import get_pose_pool
+from result_cache import get_result_cache, make_key
+from classify import classify_armrest_height
 
+# Shared by all requests in the process. Precheck and pose of one image run in sequence (pose needs
+# the person box); the armrest search and the landmark annotation then run side by side.
+STAGE_WORKERS = int(os.environ.get("ARMREST_STAGE_WORKERS", "4"))
+logger = logging.getLogger(__name__)
 
+_stage_executor = None
+_stage_executor_lock = threading.Lock()
 
-def process_image_flow(pil_image, original_filename):
-    clean_intermediate_dir()
-    frame = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
 
-    # Step 1: Environment detection (person, chair, desk)
-    env_annotated, env_json = analyze_environment(frame, original_filename)
+def get_stage_executor():
+    global _stage_executor
+    with _stage_executor_lock:
+        if _stage_executor is None:
+            _stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="flow-stage")
+        return _stage_executor
 
-    # Save environment annotated image
-    save_intermediate_image(env_annotated, original_filename, "env_annotated")
-    
-    print("env annotation done")
 
-    landmarks = detect_arm_landmarks(frame, side='right')
-    if not landmarks:
-        return env_annotated, {**env_json, "arm_landmarks_detected": False}
-    
-    print("arm detection done")
-    # Annotate arm landmarks
-    print( landmarks)
-    arm_annotated = frame.copy()
+def configure_stage_executor(workers=STAGE_WORKERS):
+    """Replace the process-wide stage pool, e.g. to fit the number of concurrent requests."""
+    global _stage_executor
+    with _stage_executor_lock:
+        if _stage_executor is not None:
+            _stage_executor.shutdown(wait=False)
+        _stage_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="flow-stage")
+        return _stage_executor
+
+# Events yielded by iter_process_image_flow
+EnvEvent = namedtuple("EnvEvent", ["annotated", "result"])
+LandmarksEvent = namedtuple("LandmarksEvent", ["landmarks", "annotated"])
+ArmrestEvent = namedtuple("ArmrestEvent", ["armrest_box", "desk_y", "annotated"])
+ClassificationEvent = namedtuple("ClassificationEvent", ["label"])
+ArtifactsEvent = namedtuple("ArtifactsEvent", ["request_id", "names"])
+ResultEvent = namedtuple("ResultEvent", ["annotated", "result", "cached"])
+
+# Bump whenever a change to the pipeline alters its output, so cached results are not reused.
+PIPELINE_VERSION = "5"
+
+
+def pipeline_fingerprint():
+    """Identifies the pipeline and model versions that produced a result."""
+    weights = detectors.backend_fingerprint()
+    return (f"{PIPELINE_VERSION}|{weights}|{env_analysis.IMG_SIZE}|{env_analysis.CONF_THRESHOLD}"
+            f"|pose{get_pose_pool().model_complexity}|max{WORKING_MAX_SIDE}")
+
+
+def _scale_desk_y(desk_y, scale):
+    return desk_y if desk_y < 0 else int(round(desk_y * scale))
+
+
+def _cached_response(entry):
+    result_json = copy.deepcopy(entry.result_json)
+    annotated = entry.annotated.copy() if entry.annotated is not None else None
+    return annotated, result_json
+
+
+def annotate_arm_landmarks(frame, landmarks, original_filename, artifacts=None):
+    arm_annotated = Annotation(frame)
     for name, coords in landmarks.items():
         x_px = int(coords['x'])
         y_px = int(coords['y'])
 
         # Draw the landmark point
-        cv2.circle(arm_annotated, (x_px, y_px), 5, (0, 255, 0), -1)
-        cv2.putText(arm_annotated, name, (x_px + 5, y_px - 5),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1, cv2.LINE_AA)
+        arm_annotated.circle((x_px, y_px), 5, (0, 255, 0), -1)
+        arm_annotated.text(name, (x_px + 5, y_px - 5), 0.5, (0, 255, 0), 1, cv2.LINE_AA)
     # Save arm landmark annotated image
-    save_intermediate_image(arm_annotated, original_filename, "arm_landmarks_annotated")
-    
-    print("arm landmark annotation done")
-    # Step 3: Detect armrest and annotate over environment annotated image
-    armrest_annotated, armrest_box, desk_y = detect_armrest_and_annotate(env_annotated, landmarks, original_filename,
-                                                                          isDesk=env_json.get("isDesk", False), 
-                                                                          isChair=env_json.get("isChair", True))
-
-    # Save armrest annotated image
-    save_intermediate_image(armrest_annotated, original_filename, "armrest_annotated")
-
-    result_json = {
-        **env_json,
-        "arm_landmarks_detected": True,
-        "landmarks": landmarks,
-        "armrest_box": armrest_box,
-        "desk_y" : desk_y
-    }
-
-    annotated_pil = Image.fromarray(cv2.cvtColor(armrest_annotated, cv2.COLOR_BGR2RGB))
-
-    return annotated_pil, result_json
\ No newline at end of file
+    save_intermediate_image(arm_annotated, original_filename, "arm_landmarks_annotated", artifacts)
+    return arm_annotated
+
+
+def process_image_flow(image, original_filename, precheck_batcher=None, request_id=None, cache=None,
+                       use_cache=True, profiler=None):
+    """Run the full pipeline on one image.
+
+    `image` is a PIL image or, faster, an image_handler.DecodedImage from
+    decode_image(), which is already BGR at working resolution.
+
+    Intermediate images are recorded in the artifact store under `request_id`
+    (see image_handler.get_artifact_store) instead of a shared directory.
+    Results are looked up in / stored to `cache` (default: the process-wide
+    result cache); a cache hit records no intermediate images.
+
+    Pose runs on a padded crop around the person the precheck found; when it
+    found no person, pose, the armrest search and their annotations are
+    skipped and the precheck result is returned as is.
+
+    All stages run on a copy downscaled to at most WORKING_MAX_SIDE pixels;
+    landmarks, armrest box and desk_y in the result are mapped back to source
+    image coordinates, while the annotated image stays at working resolution.
+
+    The annotated image is returned as an annotation.Annotation: draw
+    operations over the working frame, rasterized only when a caller asks for
+    it with render() / to_pil() / to_jpeg(), optionally at preview size.
+
+    Pass a metrics.Profiler as `profiler` (or set ARMREST_PROFILE=cprofile) to
+    profile the request; stages then run serially in the calling thread.
+    """
+    if profiler is None and PROFILE_MODE:
+        profiler = Profiler(PROFILE_MODE)
+        with profiler:
+            result = _process_image_flow(image, original_filename, precheck_batcher, request_id, cache,
+                                         use_cache, InlineExecutor())
+        logger.info("profile for %s:\n%s", original_filename, profiler.report())
+        return result
+    if profiler is not None:
+        with profiler:
+            return _process_image_flow(image, original_filename, precheck_batcher, request_id, cache,
+                                       use_cache, InlineExecutor())
+    return _process_image_flow(image, original_filename, precheck_batcher, request_id, cache, use_cache,
+                               get_stage_executor())
+
+
+def _process_image_flow(image, original_filename, precheck_batcher, request_id, cache, use_cache, executor):
+    for event in _iter_flow(image, original_filename, precheck_batcher, request_id, cache, use_cache, executor,
+                            classify=False):
+        if isinstance(event, ResultEvent):
+            return event.annotated, event.result
+
+
+def iter_process_image_flow(image, original_filename, precheck_batcher=None, request_id=None, cache=None,
+                            use_cache=True, classify=True):
+    """process_image_flow as a generator of events, yielded as each stage finishes.
+
+    Yields EnvEvent once the precheck is done, then LandmarksEvent and
+    ArmrestEvent when a person was found, ClassificationEvent (unless
+    classify=False), ArtifactsEvent and finally ResultEvent, which carries
+    exactly what process_image_flow returns. A cache hit yields only the last
+    three. Event images are annotation.Annotation objects at working resolution.
+    """
+    return _iter_flow(image, original_filename, precheck_batcher, request_id, cache, use_cache,
+                      get_stage_executor(), classify)
+
+
+def _iter_flow(image, original_filename, precheck_batcher, request_id, cache, use_cache, executor, classify):
+    if isinstance(image, DecodedImage):
+        key_frame = image.frame
+        fingerprint = pipeline_fingerprint() + "|decoded"
+    else:
+        with metrics.span("decode"):
+            key_frame = np.asarray(image)
+        fingerprint = pipeline_fingerprint()
+    cache_key = None
+    if use_cache:
+        cache = cache or get_result_cache()
+        with metrics.span("cache_lookup"):
+            cache_key = make_key(key_frame, fingerprint)
+            entry = cache.get(cache_key)
+        if entry is not None:
+            metrics.incr("cache_hit")
+            annotated, result_json = _cached_response(entry)
+            if classify:
+                yield ClassificationEvent(classify_armrest_height(result_json))
+            yield ArtifactsEvent(request_id, [])
+            yield ResultEvent(annotated, result_json, True)
+            return
+        metrics.incr("cache_miss")
+    artifacts = get_artifact_store().begin(request_id)
+    if isinstance(image, DecodedImage):
+        frame, scale = image.frame, image.scale
+    else:
+        # Resize before the color conversion so only the small image is copied.
+        with metrics.span("resize"):
+            working_rgb, scale = to_working_resolution(key_frame)
+            frame = cv2.cvtColor(working_rgb, cv2.COLOR_RGB2BGR)
+
+    def precheck():
+        # Step 1: Environment detection (person, chair, desk)
+        precheck_result = precheck_frame(frame, precheck_batcher)
+        env_annotated, env_json = annotate_environment(frame, precheck_result)
+        # Save environment annotated image
+        save_intermediate_image(env_annotated, original_filename, "env_annotated", artifacts)
+        return env_annotated, env_json, person_box(precheck_result)
+
+    def pose(env):
+        # Step 2: Arm landmarks of the detected person; nothing to look for without one
+        box = env[2]
+        if box is None:
+            metrics.incr("precheck_early_exit")
+            return None
+        return detect_arm_landmarks(frame, side='right', person_box=box)
+
+    def arm_annotation(landmarks):
+        if landmarks:
+            return annotate_arm_landmarks(frame, landmarks, original_filename, artifacts)
+        return None
+
+    def armrest(env, landmarks):
+        # Step 3: Detect armrest and annotate over environment annotated image
+        if not landmarks:
+            return None
+        env_annotated, env_json, _ = env
+        armrest_annotated, armrest_box, desk_y = detect_armrest_and_annotate(frame, landmarks, original_filename,
+                                                                              isDesk=env_json.get("isDesk", False),
+                                                                              isChair=env_json.get("isChair", True),
+                                                                              artifacts=artifacts,
+                                                                              annotation=env_annotated)
+        # Save armrest annotated image
+        save_intermediate_image(armrest_annotated, original_filename, "armrest_annotated", artifacts)
+        return armrest_annotated, armrest_box, desk_y
+
+    graph = StageGraph()
+    graph.add("precheck", precheck)
+    graph.add("pose", pose, deps=("precheck",))
+    graph.add("arm_annotation", arm_annotation, deps=("pose",))
+    graph.add("armrest", armrest, deps=("precheck", "pose"))
+    results = {}
+    for name, result in graph.iter_run(executor):
+        results[name] = result
+        if name == "precheck":
+            yield EnvEvent(result[0], result[1])
+        elif name == "arm_annotation" and result is not None:
+            yield LandmarksEvent(scale_landmarks(results["pose"], scale), result)
+        elif name == "armrest" and result is not None:
+            armrest_annotated, armrest_box, desk_y = result
+            yield ArmrestEvent(scale_box(armrest_box, scale), _scale_desk_y(desk_y, scale), armrest_annotated)
+
+    env_annotated, env_json, _ = results["precheck"]
+    landmarks = results["pose"]
+    if not landmarks:
+        result_json = {**env_json, "arm_landmarks_detected": False}
+        if cache_key:
+            cache.put(cache_key, copy.deepcopy(result_json), env_annotated.copy())
+        annotated = env_annotated
+    else:
+        armrest_annotated, armrest_box, desk_y = results["armrest"]
+        result_json = {
+            **env_json,
+            "arm_landmarks_detected": True,
+            "landmarks": scale_landmarks(landmarks, scale),
+            "armrest_box": scale_box(armrest_box, scale),
+            "desk_y" : _scale_desk_y(desk_y, scale)
+        }
+
+        if cache_key:
+            cache.put(cache_key, copy.deepcopy(result_json), armrest_annotated.copy())
+
+        annotated = armrest_annotated
+
+    if classify:
+        yield ClassificationEvent(classify_armrest_height(result_json))
+    yield ArtifactsEvent(request_id, artifacts.names())
+    yield ResultEvent(annotated, result_json, False)
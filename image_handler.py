@@ -1,24 +1,300 @@
+import io
 import os
 import cv2
-import shutil
+import queue
+import threading
+import uuid
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from annotation import Annotation
+from metrics import metrics
 
 INTERMEDIATE_DIR = "intermediate_images"
-os.makedirs(INTERMEDIATE_DIR, exist_ok=True)
 
-def clean_intermediate_dir():
-    if not os.path.exists(INTERMEDIATE_DIR):
-        os.makedirs(INTERMEDIATE_DIR)
-        return
+# Artifact store settings
+#   off    - intermediate images are dropped
+#   memory - kept in memory per request, bounded by ARTIFACT_BUDGET_MB
+#   disk   - as memory, plus PNGs written by a background thread to INTERMEDIATE_DIR/<request_id>/
+ARTIFACT_MODES = ("off", "memory", "disk")
+ARTIFACT_MODE = os.environ.get("ARMREST_ARTIFACTS", "memory")
+ARTIFACT_BUDGET_MB = float(os.environ.get("ARMREST_ARTIFACT_BUDGET_MB", "256"))
+
+
+# Longest side of the image the models and armrest search work on.
+WORKING_MAX_SIDE = int(os.environ.get("ARMREST_WORKING_MAX_SIDE", "1280"))
+
+
+def to_working_resolution(image, max_side=WORKING_MAX_SIDE):
+    """Downscale `image` so its longest side is at most `max_side`.
+
+    Returns (working_image, scale) where scale maps working coordinates back
+    to source coordinates (source = working * scale). Small images are
+    returned unchanged with scale 1.0.
+    """
+    h, w = image.shape[:2]
+    longest = max(h, w)
+    if not max_side or longest <= max_side:
+        return image, 1.0
+    ratio = max_side / longest
+    working = cv2.resize(image, (max(1, round(w * ratio)), max(1, round(h * ratio))), interpolation=cv2.INTER_AREA)
+    return working, longest / max_side
+
+
+def scale_landmarks(landmarks, scale):
+    if scale == 1.0 or not landmarks:
+        return landmarks
+    return {name: {"x": int(round(c["x"] * scale)), "y": int(round(c["y"] * scale))} for name, c in landmarks.items()}
+
+
+def scale_box(box, scale):
+    """Scale an armrest candidate {"x", "y", "w", "h", ...} to source coordinates."""
+    if scale == 1.0 or not box:
+        return box
+    scaled = dict(box)
+    for key in ("x", "y", "w", "h"):
+        scaled[key] = int(round(box[key] * scale))
+    if "score" in box:
+        scaled["score"] = float(box["score"]) * scale
+    return scaled
+
+
+# A decoded upload: BGR uint8 frame at working resolution, and the factor mapping
+# frame coordinates back to the source image (source = frame * scale).
+DecodedImage = namedtuple("DecodedImage", ["frame", "scale"])
+
+# JPEG DCT scaling: decode at 1/n size for a fraction of the full decode cost
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def _decode_with_pil(image, reduce_by):
+    """Fallback for files OpenCV can't decode; `image` is an opened, not yet loaded PIL image."""
+    if image.format == "JPEG" and reduce_by > 1:
+        image.draft("RGB", (image.width // reduce_by, image.height // reduce_by))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2BGR)
+
+
+def decode_image(data, max_side=WORKING_MAX_SIDE):
+    """Decode encoded image bytes straight to a BGR frame at working resolution.
+
+    JPEGs are decoded at 1/2, 1/4 or 1/8 scale whenever that still leaves at
+    least `max_side` pixels on the long side, so a phone photo is never fully
+    decoded. EXIF orientation is applied. Returns a DecodedImage; raises
+    ValueError if the bytes are not a readable image.
+    """
+    with metrics.span("decode"):
+        try:
+            # Only parses the header
+            header = Image.open(io.BytesIO(data))
+        except (UnidentifiedImageError, OSError) as e:
+            raise ValueError(f"could not decode image: {e}")
+        longest = max(header.size)
+        reduce_by = 1
+        if header.format == "JPEG" and max_side:
+            while reduce_by < 8 and longest // (reduce_by * 2) >= max_side:
+                reduce_by *= 2
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), _REDUCED_FLAGS[reduce_by])
+        if frame is None:
+            try:
+                frame = _decode_with_pil(header, reduce_by)
+            except OSError as e:
+                raise ValueError(f"could not decode image: {e}")
+        working, _ = to_working_resolution(frame, max_side)
+    return DecodedImage(working, longest / max(working.shape[:2]))
+
+
+def decode_file(path, max_side=WORKING_MAX_SIDE):
+    with open(path, "rb") as f:
+        return decode_image(f.read(), max_side)
+
+
+def scene_signature(frame, size=32):
+    """Tiny grayscale thumbnail for cheap scene-change checks (mean abs difference, 0-255)."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+def _rendered(image):
+    return image.render() if isinstance(image, Annotation) else image
+
+
+class RequestArtifacts:
+    """Intermediate images produced while processing one request, in insertion order.
 
-    for item in os.listdir(INTERMEDIATE_DIR):
-        item_path = os.path.join(INTERMEDIATE_DIR, item)
-        if os.path.isfile(item_path) or os.path.islink(item_path):
-            os.remove(item_path)
+    Annotations are stored as they are and only rendered when read or written to disk.
+    """
+
+    def __init__(self, store, request_id):
+        self.store = store
+        self.request_id = request_id
+        self.enabled = store.mode != "off"
+        self._images = OrderedDict()
+        self.nbytes = 0
+
+    def put(self, image, base_name, suffix):
+        if not self.enabled:
+            return
+        if isinstance(image, Annotation):
+            # The caller may keep drawing on its annotation
+            image = image.copy()
         else:
-            shutil.rmtree(item_path)
+            # Crops are views into a full frame; keep only the crop alive.
+            image = np.ascontiguousarray(image)
+        with self.store._lock:
+            old = self._images.pop(suffix, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._images[suffix] = image
+            self.nbytes += image.nbytes
+            # Under the same (reentrant) lock, so no other request can evict this one in between
+            self.store._added(self, image.nbytes - (old.nbytes if old is not None else 0))
+        if self.store.mode == "disk":
+            self.store._write_async(self.request_id, base_name, suffix, image)
+
+    def get(self, suffix):
+        return _rendered(self._images.get(suffix))
+
+    def names(self):
+        with self.store._lock:
+            return list(self._images)
+
+    def items(self):
+        with self.store._lock:
+            items = list(self._images.items())
+        return [(suffix, _rendered(image)) for suffix, image in items]
+
+
+class ArtifactStore:
+    """Per-request intermediate images with a global memory budget.
+
+    When the budget is exceeded, whole requests are evicted least recently
+    used first; the request currently being written is never evicted.
+    """
+
+    def __init__(self, mode=ARTIFACT_MODE, budget_mb=ARTIFACT_BUDGET_MB, out_dir=None):
+        if mode not in ARTIFACT_MODES:
+            raise ValueError(f"artifact mode must be one of {ARTIFACT_MODES}, got {mode!r}")
+        self.mode = mode
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.out_dir = out_dir or INTERMEDIATE_DIR
+        self._requests = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.RLock()
+        self._disk_queue = None
+        self._disk_thread = None
+
+    def begin(self, request_id=None):
+        request_id = request_id or uuid.uuid4().hex
+        artifacts = RequestArtifacts(self, request_id)
+        if self.mode == "off":
+            return artifacts
+        with self._lock:
+            previous = self._requests.pop(request_id, None)
+            if previous is not None:
+                self._nbytes -= previous.nbytes
+            self._requests[request_id] = artifacts
+        return artifacts
+
+    def get(self, request_id):
+        with self._lock:
+            artifacts = self._requests.get(request_id)
+            if artifacts is not None:
+                self._requests.move_to_end(request_id)
+            return artifacts
+
+    def discard(self, request_id):
+        with self._lock:
+            artifacts = self._requests.pop(request_id, None)
+            if artifacts is not None:
+                self._nbytes -= artifacts.nbytes
+
+    def _added(self, artifacts, delta):
+        with self._lock:
+            if self._requests.get(artifacts.request_id) is not artifacts:
+                # Evicted (or discarded) while still being written; no longer counted.
+                return
+            self._nbytes += delta
+            self._requests.move_to_end(artifacts.request_id)
+            while self._nbytes > self.budget_bytes and len(self._requests) > 1:
+                _, evicted = self._requests.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def _write_async(self, request_id, base_name, suffix, image):
+        with self._lock:
+            if self._disk_thread is None:
+                self._disk_queue = queue.Queue()
+                self._disk_thread = threading.Thread(target=self._disk_loop, name="artifact-writer", daemon=True)
+                self._disk_thread.start()
+        self._disk_queue.put((request_id, base_name, suffix, image))
+
+    def _disk_loop(self):
+        while True:
+            item = self._disk_queue.get()
+            if item is None:
+                self._disk_queue.task_done()
+                return
+            request_id, base_name, suffix, image = item
+            try:
+                request_dir = os.path.join(self.out_dir, request_id)
+                os.makedirs(request_dir, exist_ok=True)
+                filename = f"{os.path.splitext(base_name)[0]}_{suffix}.png"
+                cv2.imwrite(os.path.join(request_dir, filename), _rendered(image))
+            finally:
+                self._disk_queue.task_done()
+
+    def flush(self):
+        """Block until every queued disk write has finished."""
+        if self._disk_queue is not None:
+            self._disk_queue.join()
+
+    def close(self):
+        if self._disk_thread is not None:
+            self._disk_queue.put(None)
+            self._disk_thread.join()
+            self._disk_thread = None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArtifactStore()
+        return _store
+
+
+def configure_artifact_store(mode=ARTIFACT_MODE, budget_mb=ARTIFACT_BUDGET_MB, out_dir=None):
+    """Replace the process-wide artifact store."""
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+        _store = ArtifactStore(mode=mode, budget_mb=budget_mb, out_dir=out_dir)
+        return _store
+
+
+def save_intermediate_image(image, base_name, suffix, artifacts=None):
+    """Record an intermediate image for the current request (no-op without an artifacts handle).
 
-def save_intermediate_image(image, base_name, suffix):
-    filename = f"{os.path.splitext(base_name)[0]}_{suffix}.png"
-    path = os.path.join(INTERMEDIATE_DIR, filename)
-    cv2.imwrite(path, image)
-    return path
\ No newline at end of file
+    Annotations are recorded unrendered; see RequestArtifacts.
+    """
+    if artifacts is not None and artifacts.enabled:
+        with metrics.span("artifact_write"):
+            artifacts.put(image, base_name, suffix)
@@ -0,0 +1,158 @@
+"""Closed-loop load generator for server.py.
+
+Keeps `--concurrency` requests in flight for `--duration` seconds, posting the
+same image each time, and reports throughput, latency percentiles and the mix
+of status codes (429/503 show where backpressure kicks in).
+
+    python loadgen.py photo.jpg --url http://127.0.0.1:8080/classify --concurrency 16 --duration 30
+
+Repeated pixels hit the server's result cache, so by default every request
+gets a fresh variant with a small corner patch changed, re-encoded in the
+source format (so a JPEG still exercises the server's reduced JPEG decode).
+Variants are encoded on background threads a small ring ahead of the clients;
+--no-cache-bust sends the file unchanged.
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+
+class VariantSource:
+    """An endless supply of distinct re-encodings of one image, kept `ring` bodies ahead."""
+
+    PATCH = 16    # large enough to survive the server's 1/8 JPEG decode and resize
+
+    def __init__(self, data, ring=16, encoders=2):
+        from PIL import Image
+        source = Image.open(io.BytesIO(data))
+        self.format = source.format or "PNG"
+        self.exif = source.info.get("exif")
+        self.image = source.convert("RGB")
+        self.ring = ring
+        self.encoders = encoders
+        self._counter = itertools.count()
+        self._queue = None
+        self._tasks = []
+
+    def _encode(self, i):
+        img = self.image.copy()
+        img.paste((i % 256, (i // 256) % 256, (i // 65536) % 256), (0, 0, self.PATCH, self.PATCH))
+        buf = io.BytesIO()
+        options = {}
+        if self.format == "JPEG":
+            # Keep the orientation tag the server applies
+            options = {"quality": 95, "exif": self.exif or b""}
+        img.save(buf, format=self.format, **options)
+        return buf.getvalue()
+
+    async def _produce(self):
+        while True:
+            body = await asyncio.to_thread(self._encode, next(self._counter))
+            await self._queue.put(body)
+
+    async def get(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.ring)
+            self._tasks = [asyncio.create_task(self._produce()) for _ in range(self.encoders)]
+        return await self._queue.get()
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+
+
+class FixedSource:
+    def __init__(self, data):
+        self.data = data
+
+    async def get(self):
+        return self.data
+
+    def close(self):
+        pass
+
+
+async def _post(host, port, path, body):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        request = (f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(body)}\r\n"
+                   f"Content-Type: application/octet-stream\r\nConnection: close\r\n\r\n").encode()
+        writer.write(request + body)
+        await writer.drain()
+        status_line = await reader.readline()
+        status = int(status_line.split()[1])
+        await reader.read()
+        return status
+    finally:
+        writer.close()
+
+
+async def run(url, bodies, concurrency, duration):
+    """`bodies` is a VariantSource or FixedSource; waiting for a body is not counted as latency."""
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    deadline = time.perf_counter() + duration
+    latencies = []
+    statuses = Counter()
+
+    async def client():
+        while time.perf_counter() < deadline:
+            body = await bodies.get()
+            start = time.perf_counter()
+            try:
+                status = await _post(parts.hostname, parts.port or 80, path, body)
+            except (ConnectionError, OSError, ValueError, IndexError):
+                status = "connection_error"
+            statuses[status] += 1
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            elif status in (429, 503):
+                await asyncio.sleep(0.05)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+    finally:
+        bodies.close()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def pct(p):
+        return round(1000 * latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1) if latencies else None
+
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "ok_per_s": round(len(latencies) / elapsed, 2),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the armrest inference server.")
+    parser.add_argument("image")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/classify")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--no-cache-bust", action="store_true", help="send identical bytes every time")
+    args = parser.parse_args(argv)
+
+    with open(args.image, "rb") as f:
+        data = f.read()
+    bodies = FixedSource(data) if args.no_cache_bust else VariantSource(data)
+    report = asyncio.run(run(args.url, bodies, args.concurrency, args.duration))
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
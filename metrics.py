@@ -0,0 +1,179 @@
+"""Lightweight in-process instrumentation for the pipeline.
+
+Stages record wall-clock spans and outcome counters into a process-wide
+registry, which can be exported as Prometheus text or JSON:
+
+    from metrics import metrics
+    with metrics.span("pose"):
+        ...
+    metrics.incr("no_landmarks")
+    print(metrics.to_prometheus())
+
+A per-request profiler (cProfile, or pyinstrument when installed) can be
+attached with Profiler; see process_image_flow(profiler=...).
+"""
+import io
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "armrest"
+PROFILE_MODE = os.environ.get("ARMREST_PROFILE") or None
+
+
+def json_default(value):
+    """json.dumps `default=` hook for the numpy scalars that end up in result json and reports."""
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class _Timing:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def quantile(self, q):
+        """Approximate quantile from the histogram (upper bound of the bucket)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            seen += n
+            if seen >= target:
+                return bound
+        return self.max
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._counters = {}
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            timing = self._timings.get(stage)
+            if timing is None:
+                timing = self._timings[stage] = _Timing()
+            timing.observe(seconds)
+
+    def incr(self, event, n=1):
+        with self._lock:
+            self._counters[event] = self._counters.get(event, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "stages": {
+                    stage: {
+                        "count": t.count,
+                        "total_s": t.total,
+                        "mean_ms": 1000 * t.total / t.count if t.count else 0.0,
+                        "p50_ms": 1000 * t.quantile(0.5),
+                        "p95_ms": 1000 * t.quantile(0.95),
+                        "max_ms": 1000 * t.max,
+                    }
+                    for stage, t in sorted(self._timings.items())
+                },
+                "counters": dict(sorted(self._counters.items())),
+            }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_prometheus(self):
+        lines = [
+            f"# HELP {PREFIX}_stage_seconds Wall-clock time spent in each pipeline stage.",
+            f"# TYPE {PREFIX}_stage_seconds histogram",
+        ]
+        with self._lock:
+            timings = sorted(self._timings.items())
+            counters = sorted(self._counters.items())
+        for stage, t in timings:
+            cumulative = 0
+            for bound, n in zip(BUCKETS, t.buckets):
+                cumulative += n
+                lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {t.count}')
+            lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {t.total:.6f}')
+            lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {t.count}')
+        lines.append(f"# HELP {PREFIX}_events_total Pipeline outcomes.")
+        lines.append(f"# TYPE {PREFIX}_events_total counter")
+        for event, n in counters:
+            lines.append(f'{PREFIX}_events_total{{event="{event}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class Profiler:
+    """Profiles one request with cProfile or pyinstrument.
+
+    pyinstrument is optional; asking for it when it is not installed raises
+    ImportError at construction time.
+    """
+
+    def __init__(self, kind="cprofile"):
+        if kind not in ("cprofile", "pyinstrument"):
+            raise ValueError(f"unknown profiler {kind!r}")
+        self.kind = kind
+        if kind == "pyinstrument":
+            from pyinstrument import Profiler as _PyinstrumentProfiler
+            self._profiler = _PyinstrumentProfiler()
+        else:
+            import cProfile
+            self._profiler = cProfile.Profile()
+
+    def __enter__(self):
+        if self.kind == "pyinstrument":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self.kind == "pyinstrument":
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def report(self, limit=30):
+        if self.kind == "pyinstrument":
+            return self._profiler.output_text(unicode=True)
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,149 @@
+"""Shared, lazily loaded model registry.
+
+Heavy dependencies (ultralytics/torch, mediapipe) are only imported when a
+model is first requested, so `import flow` stays cheap and a process can start
+serving before the models are loaded. Modules register a loader under a name;
+`get(name)` loads it once (thread-safe) and `warmup()` loads everything up
+front, optionally in the background. Loaders return ready-to-serve (warmed)
+models.
+
+    python models.py               # import and model load timings
+"""
+import importlib
+import sys
+import threading
+import time
+
+_PROCESS_START = time.perf_counter()
+
+_loaders = {}
+_instances = {}
+_locks = {}
+_registry_lock = threading.Lock()
+_warmup_thread = None
+_warmup_error = None
+
+IMPORT_TIMINGS = {}
+LOAD_TIMINGS = {}
+
+
+def timed_import(module_name):
+    """Import a module and record how long the first import took."""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    IMPORT_TIMINGS.setdefault(module_name, time.perf_counter() - start)
+    return module
+
+
+def register(name, loader, replace=True):
+    """Register `loader()` as the way to build model `name`.
+
+    With replace=True an already loaded instance is dropped, which is how
+    benchmarks and tests swap in stand-in models.
+    """
+    with _registry_lock:
+        if not replace and name in _loaders:
+            return
+        _loaders[name] = loader
+        _locks.setdefault(name, threading.Lock())
+        if replace:
+            _instances.pop(name, None)
+
+
+def get(name):
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    with _registry_lock:
+        if name not in _loaders:
+            raise KeyError(f"no model registered under {name!r}")
+        lock = _locks[name]
+    with lock:
+        instance = _instances.get(name)
+        if instance is None:
+            start = time.perf_counter()
+            instance = _loaders[name]()
+            LOAD_TIMINGS[name] = time.perf_counter() - start
+            _instances[name] = instance
+    return instance
+
+
+def is_loaded(name):
+    return name in _instances
+
+
+def names():
+    with _registry_lock:
+        return list(_loaders)
+
+
+def _warmup(model_names):
+    global _warmup_error
+    try:
+        for name in model_names:
+            get(name)
+    except Exception as e:
+        _warmup_error = e
+        raise
+
+
+def warmup(model_names=None, background=False):
+    """Load (and warm) the given models, or all registered ones.
+
+    With background=True the loading runs on a daemon thread, which is
+    returned; ready() reports when it has finished.
+    """
+    global _warmup_thread
+    model_names = list(model_names or names())
+    if not background:
+        _warmup(model_names)
+        return None
+    with _registry_lock:
+        if _warmup_thread is None or not _warmup_thread.is_alive():
+            _warmup_thread = threading.Thread(target=_warmup, args=(model_names,), name="model-warmup",
+                                              daemon=True)
+            _warmup_thread.start()
+        return _warmup_thread
+
+
+def ready(model_names=None):
+    return all(is_loaded(name) for name in (model_names or names()))
+
+
+def warmup_error():
+    return _warmup_error
+
+
+def startup_report():
+    return {
+        "since_start_s": time.perf_counter() - _PROCESS_START,
+        "imports_s": dict(IMPORT_TIMINGS),
+        "model_loads_s": dict(LOAD_TIMINGS),
+        "loaded": [name for name in names() if is_loaded(name)],
+    }
+
+
+def _main():
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="Report import and model load costs.")
+    parser.add_argument("--no-warmup", action="store_true", help="only measure the import of the app modules")
+    args = parser.parse_args()
+    # Running as a script makes this module __main__; the app registers its
+    # models with the importable `models` module, so report on that one.
+    registry = importlib.import_module("models")
+    start = time.perf_counter()
+    registry.timed_import("flow")
+    registry.timed_import("classify")
+    import_done = time.perf_counter() - start
+    if not args.no_warmup:
+        registry.warmup()
+    report = registry.startup_report()
+    report["app_import_s"] = import_done
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,147 @@
+"""Multi-person mode: one result per workstation in the frame.
+
+process_image_flow answers for a single person. Here every YOLO person box
+is paired with its nearest chair and desk (env_analysis.pair_workstations),
+pose runs on each person's padded crop in parallel through the pose pool,
+and the armrest search and classification run per person.
+
+    python multi_person.py office.jpg --annotated office_annotated.jpg
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from arm_detection import desk_band, detect_arm_landmarks, search_armrest
+from annotation import Annotation
+from classify import classify_armrest_height
+from env_analysis import (BOX_COLOR, build_json, detect_batch, get_model, get_posture, pair_workstations,
+                          workstation_labels)
+from image_handler import get_artifact_store, save_intermediate_image
+from image_handler import DecodedImage, decode_file, scale_box, scale_landmarks, to_working_resolution
+from metrics import metrics
+
+PERSON_WORKERS = int(os.environ.get("ARMREST_PERSON_WORKERS", "4"))
+_person_executor = None
+_person_executor_lock = threading.Lock()
+
+
+def get_person_executor():
+    global _person_executor
+    with _person_executor_lock:
+        if _person_executor is None:
+            _person_executor = ThreadPoolExecutor(max_workers=PERSON_WORKERS, thread_name_prefix="person")
+        return _person_executor
+
+
+LANDMARK_COLOR = (0, 255, 0)
+ARMREST_COLOR = (200, 180, 0)
+DESK_COLOR = (100, 100, 255)
+LABEL_COLORS = {"Optimal": (0, 200, 0), "Too High": (0, 0, 255), "Too Low": (0, 140, 255)}
+
+
+def _scale_xyxy(box, scale):
+    return None if box is None else [int(round(v * scale)) for v in box]
+
+
+def analyze_person(frame, station):
+    """Pose, armrest search and desk estimate for one workstation, in frame coordinates."""
+    labels = workstation_labels(station)
+    result = build_json(labels, get_posture(labels))
+    landmarks = detect_arm_landmarks(frame, side='right', person_box=station["person"])
+    if not landmarks:
+        return {**result, "arm_landmarks_detected": False}
+    armrest_box = (search_armrest(frame, landmarks) or {}) if result["isChair"] else {}
+    desk_y = desk_band(landmarks, frame.shape)[1] if result["isDesk"] else -1
+    return {**result, "arm_landmarks_detected": True, "landmarks": landmarks, "armrest_box": armrest_box,
+            "desk_y": desk_y}
+
+
+def annotate_people(frame, stations, people):
+    annotated = Annotation(frame)
+    for index, (station, person) in enumerate(zip(stations, people)):
+        for key in ("chair", "desk"):
+            if station[key] is not None:
+                x1, y1, x2, y2 = map(int, station[key])
+                annotated.rectangle((x1, y1), (x2, y2), BOX_COLOR, 1)
+        x1, y1, x2, y2 = map(int, station["person"])
+        color = LABEL_COLORS.get(person["classification"], BOX_COLOR)
+        annotated.rectangle((x1, y1), (x2, y2), color, 2)
+        annotated.text(f"#{index} {person['classification']}", (x1, max(15, y1 - 10)), 0.6, color, 2)
+        for coord in person.get("landmarks", {}).values():
+            annotated.circle((coord["x"], coord["y"]), 5, LANDMARK_COLOR, -1)
+        box = person.get("armrest_box")
+        if box:
+            annotated.rectangle((box["x"], box["y"]), (box["x"] + box["w"], box["y"] + box["h"]), ARMREST_COLOR, 3)
+        if person.get("desk_y", -1) >= 0:
+            desk_y = person["desk_y"]
+            annotated.line((x1, desk_y), (x2, desk_y), DESK_COLOR, 3)
+    return annotated
+
+
+def process_room_flow(image, original_filename, request_id=None, executor=None):
+    """Analyze every person in `image` (a PIL image or an image_handler.DecodedImage).
+
+    Returns the annotation (an annotation.Annotation at working resolution) and
+    {"person_count": n, "people": [...]}, where each entry has the
+    process_image_flow fields for that person plus "person_box",
+    "chair_box", "desk_box" and "classification", in source coordinates.
+    """
+    executor = executor or get_person_executor()
+    artifacts = get_artifact_store().begin(request_id)
+    if isinstance(image, DecodedImage):
+        frame, scale = image.frame, image.scale
+    else:
+        with metrics.span("decode"):
+            rgb = np.asarray(image)
+        with metrics.span("resize"):
+            working_rgb, scale = to_working_resolution(rgb)
+            frame = cv2.cvtColor(working_rgb, cv2.COLOR_RGB2BGR)
+
+    stations = pair_workstations(detect_batch([frame])[0], get_model().names)
+    metrics.incr("people_detected", len(stations))
+    # Pose estimators come from the pool, so at most pool-size crops run at once.
+    people = list(executor.map(lambda station: analyze_person(frame, station), stations))
+
+    for person in people:
+        person["classification"] = classify_armrest_height(person)
+    annotated = annotate_people(frame, stations, people)
+    save_intermediate_image(annotated, original_filename, "room_annotated", artifacts)
+
+    results = []
+    for station, person in zip(stations, people):
+        if person["arm_landmarks_detected"]:
+            person["landmarks"] = scale_landmarks(person["landmarks"], scale)
+            person["armrest_box"] = scale_box(person["armrest_box"], scale)
+            if person["desk_y"] >= 0:
+                person["desk_y"] = int(round(person["desk_y"] * scale))
+        results.append({
+            "person_box": _scale_xyxy(station["person"], scale),
+            "person_conf": station["person_conf"],
+            "chair_box": _scale_xyxy(station["chair"], scale),
+            "desk_box": _scale_xyxy(station["desk"], scale),
+            **person,
+        })
+    return annotated, {"person_count": len(results), "people": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify armrest height for every person in an image.")
+    parser.add_argument("image")
+    parser.add_argument("--annotated", help="save the annotated image here")
+    args = parser.parse_args(argv)
+
+    annotated, result = process_room_flow(decode_file(args.image), os.path.basename(args.image))
+    if args.annotated:
+        annotated.to_pil().save(args.annotated)
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
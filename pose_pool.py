@@ -0,0 +1,144 @@
+"""Pool of long-lived MediaPipe Pose estimators.
+
+Building a `mp.solutions.pose.Pose` graph loads the model and initializes the
+calculator graph, which costs far more than a single inference on a small
+image. The pool keeps a fixed number of warmed-up instances and hands them out
+one caller at a time (a Pose instance is not safe to share between threads).
+"""
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+import models
+
+DEFAULT_POOL_SIZE = int(os.environ.get("ARMREST_POSE_POOL_SIZE", "2"))
+DEFAULT_MODEL_COMPLEXITY = int(os.environ.get("ARMREST_POSE_MODEL_COMPLEXITY", "1"))
+
+
+def create_pose(model_complexity=DEFAULT_MODEL_COMPLEXITY, static_image_mode=True):
+    """A single MediaPipe Pose graph; static_image_mode=False tracks across video frames."""
+    mp = models.timed_import("mediapipe")
+    return mp.solutions.pose.Pose(static_image_mode=static_image_mode, model_complexity=model_complexity)
+
+
+class PosePool:
+    def __init__(self, size=DEFAULT_POOL_SIZE, model_complexity=DEFAULT_MODEL_COMPLEXITY, factory=None):
+        if size < 1:
+            raise ValueError("pose pool size must be at least 1")
+        self.size = size
+        self.model_complexity = model_complexity
+        self._factory = factory or (lambda: create_pose(model_complexity))
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _create(self):
+        # Called with self._lock held.
+        pose = self._factory()
+        self._all.append(pose)
+        return pose
+
+    def warmup(self):
+        """Build every instance up front and run one dummy inference through each."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("pose pool is shut down")
+            while len(self._all) < self.size:
+                self._idle.put(self._create())
+        dummy = np.zeros((64, 64, 3), dtype=np.uint8)
+        borrowed = [self._idle.get() for _ in range(self.size)]
+        try:
+            for pose in borrowed:
+                pose.process(dummy)
+        finally:
+            for pose in borrowed:
+                self._idle.put(pose)
+
+    @contextmanager
+    def borrow(self, timeout=None):
+        """Borrow a Pose instance; instances are created lazily up to `size`."""
+        pose = None
+        try:
+            pose = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("pose pool is shut down")
+                if len(self._all) < self.size:
+                    pose = self._create()
+            if pose is None:
+                pose = self._idle.get(timeout=timeout)
+        try:
+            yield pose
+        finally:
+            if self._closed:
+                pose.close()
+            else:
+                self._idle.put(pose)
+
+    def process(self, rgb_image):
+        with self.borrow() as pose:
+            return pose.process(rgb_image)
+
+    def shutdown(self):
+        """Close all idle instances; borrowed ones are closed when returned."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def get_pose_pool():
+    """Process-wide pool used by detect_arm_landmarks when none is passed in."""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = PosePool()
+        return _default_pool
+
+
+def configure_pose_pool(size=DEFAULT_POOL_SIZE, model_complexity=DEFAULT_MODEL_COMPLEXITY, factory=None):
+    """Replace the process-wide pool, shutting the previous one down."""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is not None:
+            _default_pool.shutdown()
+        _default_pool = PosePool(size=size, model_complexity=model_complexity, factory=factory)
+    models.register("pose", _load_pose_pool)
+    return _default_pool
+
+
+def shutdown_pose_pool():
+    global _default_pool
+    with _default_lock:
+        if _default_pool is not None:
+            _default_pool.shutdown()
+            _default_pool = None
+    models.register("pose", _load_pose_pool)
+
+
+def _load_pose_pool():
+    pool = get_pose_pool()
+    pool.warmup()
+    return pool
+
+
+# models.warmup() builds and warms every pooled instance
+models.register("pose", _load_pose_pool, replace=False)
@@ -0,0 +1,159 @@
+"""Content-addressed cache of pipeline results.
+
+Entries are keyed by a hash of the decoded pixels plus a pipeline/model
+fingerprint, so re-uploads of the same photo (and Streamlit reruns) skip
+inference entirely. An in-memory LRU tier is bounded by entry count and bytes;
+an optional on-disk tier survives restarts.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from annotation import Annotation
+from metrics import json_default
+
+CACHE_MAX_ENTRIES = int(os.environ.get("ARMREST_CACHE_ENTRIES", "256"))
+CACHE_MAX_MB = float(os.environ.get("ARMREST_CACHE_MB", "512"))
+CACHE_DIR = os.environ.get("ARMREST_CACHE_DIR") or None
+
+
+def make_key(frame, fingerprint):
+    h = hashlib.sha256()
+    h.update(fingerprint.encode())
+    h.update(str(frame.shape).encode())
+    h.update(str(frame.dtype).encode())
+    h.update(np.ascontiguousarray(frame).data)
+    return h.hexdigest()
+
+
+class CacheEntry:
+    __slots__ = ("result_json", "annotated", "nbytes")
+
+    def __init__(self, result_json, annotated=None):
+        self.result_json = result_json
+        self.annotated = annotated
+        # json is small; count a flat 1KB for it
+        self.nbytes = 1024 + (annotated.nbytes if annotated is not None else 0)
+
+
+class ResultCache:
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_mb=CACHE_MAX_MB, disk_dir=CACHE_DIR, store_images=True):
+        self.max_entries = max_entries
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.disk_dir = disk_dir
+        self.store_images = store_images
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        entry = self._load(key) if self.disk_dir else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, entry)
+        return entry
+
+    def put(self, key, result_json, annotated=None):
+        if not self.store_images:
+            annotated = None
+        entry = CacheEntry(result_json, annotated)
+        with self._lock:
+            self._insert(key, entry)
+        if self.disk_dir:
+            self._save(key, entry)
+        return entry
+
+    def _insert(self, key, entry):
+        # Called with self._lock held.
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._nbytes -= old.nbytes
+        self._entries[key] = entry
+        self._nbytes += entry.nbytes
+        while self._entries and (len(self._entries) > self.max_entries or self._nbytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._nbytes -= evicted.nbytes
+
+    def _paths(self, key):
+        base = os.path.join(self.disk_dir, key[:2], key)
+        return base + ".json", base + ".npy"
+
+    def _save(self, key, entry):
+        json_path, image_path = self._paths(key)
+        os.makedirs(os.path.dirname(json_path), exist_ok=True)
+        if entry.annotated is not None:
+            np.save(image_path, entry.annotated.base, allow_pickle=False)
+        # Write the json last and atomically; its presence marks the entry complete.
+        tmp_path = json_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"result_json": entry.result_json, "has_image": entry.annotated is not None,
+                       "ops": entry.annotated.ops if entry.annotated is not None else []},
+                      f, default=json_default)
+        os.replace(tmp_path, json_path)
+
+    def _load(self, key):
+        json_path, image_path = self._paths(key)
+        try:
+            with open(json_path) as f:
+                data = json.load(f)
+            annotated = None
+            if data["has_image"]:
+                annotated = Annotation(np.load(image_path, allow_pickle=False), data.get("ops"))
+        except (OSError, ValueError, KeyError):
+            return None
+        return CacheEntry(data["result_json"], annotated)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._nbytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
+
+
+def configure_result_cache(**kwargs):
+    """Replace the process-wide cache; pass max_entries=0 to disable it."""
+    global _cache
+    with _cache_lock:
+        _cache = ResultCache(**kwargs)
+        return _cache
@@ -0,0 +1,225 @@
+"""Per-camera scene cache for periodic snapshots from fixed desk cameras.
+
+A fixed camera sees the same chair and desk in every snapshot, so the YOLO
+precheck and the Canny/Hough armrest search rarely need to run again. For
+each camera the cache keeps the last precheck result (chair, desk and person
+boxes), the armrest candidate, and a 32x32 grayscale signature of the frame.
+A snapshot reuses them when the signature of the static part of the scene,
+meaning everything outside the person's box, is still close to the cached
+one. Then only MediaPipe pose runs, on the cached person region. The full
+detection runs again when the scene changes, when the person is no longer
+found in their cached box (or there was nobody to find), when the image
+size changes, or after `max_age_s`.
+
+The armrest sits inside the masked person region in a side-profile shot, so
+the signature cannot see it move. On every hit the cached armrest line is
+confirmed with a row-gradient check in a narrow band around it (as the
+streaming tracker does); if the line has weakened or shifted, the armrest
+search runs again.
+
+    annotated, result_json = process_snapshot(decode_image(jpeg_bytes), camera_id="desk-12")
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from arm_detection import armrest_line_strength, detect_arm_landmarks, detect_armrest_and_annotate, search_armrest
+from env_analysis import annotate_environment, person_box, run_precheck
+from image_handler import DecodedImage, get_artifact_store, save_intermediate_image
+from image_handler import scale_box, scale_landmarks, scene_signature, to_working_resolution
+from metrics import metrics
+
+SCENE_CHANGE_THRESHOLD = float(os.environ.get("ARMREST_SCENE_CHANGE", "8.0"))  # mean abs diff, 0-255
+SCENE_MAX_AGE_S = float(os.environ.get("ARMREST_SCENE_MAX_AGE_S", "3600"))
+SCENE_MAX_CAMERAS = int(os.environ.get("ARMREST_SCENE_MAX_CAMERAS", "1024"))
+SIGNATURE_SIZE = 32
+PERSON_MASK_PAD = 0.2     # grow the person box by this share before masking it out of the signature
+ARMREST_CHECK_BAND = 0.15     # band checked around the cached armrest line, times upper arm length
+ARMREST_MIN_STRENGTH = 0.5    # the line must keep this share of its edge strength at detection
+ARMREST_MAX_SHIFT_PX = 3      # and its strongest row may move at most this far
+
+
+class SceneState:
+    __slots__ = ("shape", "signature", "static_mask", "precheck_result", "person_box", "armrest_box",
+                 "armrest_strength", "detected_at")
+
+    def __init__(self, shape, signature, precheck_result, person_box, armrest_box=None):
+        self.shape = shape
+        self.signature = signature
+        self.precheck_result = precheck_result
+        self.person_box = person_box
+        self.armrest_box = armrest_box
+        self.armrest_strength = 0.0
+        self.static_mask = static_mask(shape, person_box)
+        self.detected_at = time.monotonic()
+
+    def scene_change(self, signature):
+        """Mean abs difference of the signatures over the static (non-person) cells."""
+        diff = np.abs(signature - self.signature)
+        return float(diff[self.static_mask].mean()) if self.static_mask.any() else float(diff.mean())
+
+
+def static_mask(shape, box, size=SIGNATURE_SIZE):
+    """Signature cells outside the (padded) person box."""
+    mask = np.ones((size, size), dtype=bool)
+    if box is None:
+        return mask
+    h, w = shape[:2]
+    x1, y1, x2, y2 = box
+    pad_x, pad_y = (x2 - x1) * PERSON_MASK_PAD, (y2 - y1) * PERSON_MASK_PAD
+    cx1 = max(0, int((x1 - pad_x) / w * size))
+    cy1 = max(0, int((y1 - pad_y) / h * size))
+    cx2 = min(size, int(np.ceil((x2 + pad_x) / w * size)))
+    cy2 = min(size, int(np.ceil((y2 + pad_y) / h * size)))
+    mask[cy1:cy2, cx1:cx2] = False
+    return mask
+
+
+class SceneCache:
+    def __init__(self, change_threshold=SCENE_CHANGE_THRESHOLD, max_age_s=SCENE_MAX_AGE_S,
+                 max_cameras=SCENE_MAX_CAMERAS):
+        self.change_threshold = change_threshold
+        self.max_age_s = max_age_s
+        self.max_cameras = max_cameras
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, camera_id, shape, signature):
+        """The camera's cached state if the scene is unchanged, else None."""
+        with self._lock:
+            state = self._states.get(camera_id)
+            if state is not None:
+                self._states.move_to_end(camera_id)
+        if state is None:
+            return None
+        if state.shape != shape or time.monotonic() - state.detected_at > self.max_age_s:
+            return None
+        if state.scene_change(signature) > self.change_threshold:
+            metrics.incr("scene_changed")
+            return None
+        return state
+
+    def put(self, camera_id, state):
+        with self._lock:
+            self._states[camera_id] = state
+            self._states.move_to_end(camera_id)
+            while len(self._states) > self.max_cameras:
+                self._states.popitem(last=False)
+
+    def invalidate(self, camera_id):
+        with self._lock:
+            self._states.pop(camera_id, None)
+
+    def cameras(self):
+        with self._lock:
+            return list(self._states)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_scene_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SceneCache()
+        return _cache
+
+
+def configure_scene_cache(**kwargs):
+    """Replace the process-wide scene cache."""
+    global _cache
+    with _cache_lock:
+        _cache = SceneCache(**kwargs)
+        return _cache
+
+
+def _detect(frame, signature):
+    """Full detection: precheck, pose on the person box and armrest search."""
+    precheck_result = run_precheck(frame)
+    box = person_box(precheck_result)
+    landmarks = detect_arm_landmarks(frame, side='right', person_box=box) if box is not None else None
+    return SceneState(frame.shape, signature, precheck_result, box), landmarks
+
+
+def _armrest_band(landmarks):
+    shoulder, elbow = landmarks["shoulder"], landmarks["elbow"]
+    upper_arm = max(1.0, float(np.hypot(shoulder["x"] - elbow["x"], shoulder["y"] - elbow["y"])))
+    return max(3, int(upper_arm * ARMREST_CHECK_BAND))
+
+
+def _armrest_confirmed(state, gray, landmarks):
+    """Whether the cached armrest line is still where it was found, with most of its edge strength."""
+    box = state.armrest_box
+    row, strength = armrest_line_strength(gray, box, _armrest_band(landmarks))
+    return (state.armrest_strength > 0 and strength >= ARMREST_MIN_STRENGTH * state.armrest_strength
+            and abs(row - (box["y"] + 5)) <= ARMREST_MAX_SHIFT_PX)
+
+
+def process_snapshot(image, camera_id, original_filename="snapshot.jpg", cache=None, request_id=None):
+    """process_image_flow for a fixed camera, reusing the camera's cached scene when it has not changed.
+
+    `image` is an image_handler.DecodedImage or a PIL image. Returns
+    (annotation, result_json) like process_image_flow; result_json also
+    says whether the cached scene was used ("scene_cache_hit").
+    """
+    cache = cache or get_scene_cache()
+    if isinstance(image, DecodedImage):
+        frame, scale = image.frame, image.scale
+    else:
+        with metrics.span("resize"):
+            working_rgb, scale = to_working_resolution(np.asarray(image))
+            frame = cv2.cvtColor(working_rgb, cv2.COLOR_RGB2BGR)
+    artifacts = get_artifact_store().begin(request_id)
+
+    with metrics.span("scene_signature"):
+        signature = scene_signature(frame, SIGNATURE_SIZE)
+    state = cache.lookup(camera_id, frame.shape, signature)
+    landmarks = None
+    if state is not None and state.person_box is not None:
+        landmarks = detect_arm_landmarks(frame, side='right', person_box=state.person_box)
+    # A cached scene with nobody in it is never reused: the person may have just sat down
+    hit = bool(landmarks)
+    if hit:
+        metrics.incr("scene_cache_hit")
+    else:
+        # New camera, changed scene, or the person left their cached box
+        metrics.incr("scene_cache_miss")
+        state, landmarks = _detect(frame, signature)
+        cache.put(camera_id, state)
+
+    env_annotated, env_json = annotate_environment(frame, state.precheck_result)
+    save_intermediate_image(env_annotated, original_filename, "env_annotated", artifacts)
+    if not landmarks:
+        return env_annotated, {**env_json, "arm_landmarks_detected": False, "scene_cache_hit": hit}
+
+    is_chair = env_json.get("isChair", True)
+    if is_chair:
+        with metrics.span("armrest_track"):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if state.armrest_box and not _armrest_confirmed(state, gray, landmarks):
+                # Raised, lowered or removed: the thing being measured, so never reused blindly
+                metrics.incr("scene_armrest_moved")
+                state.armrest_box = None
+        if not state.armrest_box:
+            state.armrest_box = search_armrest(frame, landmarks, original_filename, artifacts)
+            state.armrest_strength = (armrest_line_strength(gray, state.armrest_box, _armrest_band(landmarks))[1]
+                                      if state.armrest_box else 0.0)
+    armrest_annotated, armrest_box, desk_y = detect_armrest_and_annotate(
+        frame, landmarks, original_filename, isDesk=env_json.get("isDesk", False), isChair=is_chair,
+        artifacts=artifacts, annotation=env_annotated, armrest_box=state.armrest_box, search=False)
+    save_intermediate_image(armrest_annotated, original_filename, "armrest_annotated", artifacts)
+    result_json = {
+        **env_json,
+        "arm_landmarks_detected": True,
+        "landmarks": scale_landmarks(landmarks, scale),
+        "armrest_box": scale_box(armrest_box, scale),
+        "desk_y": desk_y if desk_y < 0 else int(round(desk_y * scale)),
+        "scene_cache_hit": hit,
+    }
+    return armrest_annotated, result_json
@@ -0,0 +1,292 @@
+"""Local HTTP inference service for the armrest classifier.
+
+An asyncio server (standard library only) in front of process_image_flow and
+classify_armrest_height. Requests wait in a bounded queue and are served by a
+fixed pool of worker threads; when the queue is full the server answers 429,
+and until the models have finished loading it answers 503.
+
+    python server.py --port 8080 --workers 4 --queue-size 32
+
+Endpoints:
+    POST /classify[?annotated=1&name=photo.jpg]   body: raw image bytes
+                  [&multi=1]                      one result per person in the frame
+                  [&preview=640]                  annotated image at most this many pixels wide/high
+                  [&camera=desk-12]               fixed camera: reuse its cached scene (scene_cache)
+    GET  /healthz                                 process is up
+    GET  /readyz                                  models are loaded
+    GET  /metrics                                 Prometheus text (?format=json)
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from metrics import json_default
+
+logger = logging.getLogger(__name__)
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error",
+    503: "Service Unavailable", 504: "Gateway Timeout",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def classify_image_bytes(data, name, annotated=False, precheck_batcher=None, multi_person=False,
+                         annotated_max_side=None, camera_id=None):
+    """Decode, run the pipeline and classify; returns the response payload."""
+    from flow import process_image_flow
+    from classify import classify_armrest_height
+    from image_handler import decode_image
+
+    try:
+        # Reduced-size JPEG decode straight to a BGR working-resolution frame
+        image = decode_image(data)
+    except ValueError as e:
+        raise HttpError(400, str(e))
+    if multi_person:
+        from multi_person import process_room_flow
+        annotated_img, payload = process_room_flow(image, name)
+    elif camera_id:
+        from scene_cache import process_snapshot
+        annotated_img, result_json = process_snapshot(image, camera_id, name)
+        payload = {"classification": classify_armrest_height(result_json), "result": result_json}
+    else:
+        annotated_img, result_json = process_image_flow(image, name, precheck_batcher=precheck_batcher)
+        payload = {"classification": classify_armrest_height(result_json), "result": result_json}
+    if annotated and annotated_img is not None:
+        # The annotation is only rasterized here, straight from BGR to JPEG
+        jpeg = annotated_img.to_jpeg(quality=85, max_side=annotated_max_side)
+        payload["annotated_jpeg_b64"] = base64.b64encode(jpeg).decode("ascii")
+    return payload
+
+
+class InferenceServer:
+    def __init__(self, host="127.0.0.1", port=8080, workers=2, queue_size=16, timeout_s=30.0,
+                 max_body_mb=25, batch_precheck=True):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout_s = timeout_s
+        self.max_body = int(max_body_mb * 1024 * 1024)
+        self.batch_precheck = batch_precheck
+        self._queue = None
+        self._executor = None
+        self._batcher = None
+        self._worker_tasks = []
+        self._server = None
+
+    async def start(self):
+        import models
+        from metrics import metrics
+        import flow  # registers the models
+        from image_handler import configure_artifact_store
+        from pose_pool import configure_pose_pool
+
+        # API callers only get the json (and optionally the annotated image).
+        configure_artifact_store("off")
+        # One pose estimator per inference worker, so workers never wait on each other.
+        configure_pose_pool(size=self.workers)
+        # Up to two stages of each request run at once (the armrest search beside the landmark annotation)
+        flow.configure_stage_executor(max(flow.STAGE_WORKERS, 2 * self.workers))
+        self._metrics = metrics
+        self._models = models
+        models.warmup(background=True)
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        if self.batch_precheck and self.workers > 1:
+            from env_analysis import PrecheckBatcher
+            self._batcher = PrecheckBatcher(max_size=self.workers)
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info("listening on http://%s:%d", self.host, self.port)
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for task in self._worker_tasks:
+            task.cancel()
+        self._executor.shutdown(wait=False)
+        if self._batcher is not None:
+            self._batcher.close()
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            data, name, annotated, multi, preview, camera, future = await self._queue.get()
+            try:
+                if future.cancelled():
+                    # The client already got its timeout; don't spend inference on it.
+                    self._metrics.incr("server_dropped_expired")
+                    continue
+                try:
+                    payload = await loop.run_in_executor(
+                        self._executor, classify_image_bytes, data, name, annotated, self._batcher, multi, preview,
+                        camera)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(payload)
+            finally:
+                self._queue.task_done()
+
+    async def _classify(self, query, body):
+        if not self._models.ready():
+            raise HttpError(503, "models are still loading")
+        if not body:
+            raise HttpError(400, "empty body; send the image bytes")
+        annotated = query.get("annotated", ["0"])[0] in ("1", "true", "yes")
+        multi = query.get("multi", ["0"])[0] in ("1", "true", "yes")
+        try:
+            preview = int(query["preview"][0]) if "preview" in query else None
+        except ValueError:
+            raise HttpError(400, "preview must be an integer pixel size")
+        camera = query.get("camera", [None])[0]
+        name = query.get("name", [f"{uuid.uuid4().hex}.jpg"])[0]
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((body, name, annotated, multi, preview, camera, future))
+        except asyncio.QueueFull:
+            self._metrics.incr("server_rejected_queue_full")
+            raise HttpError(429, "inference queue is full")
+        try:
+            with self._metrics.span("server_request"):
+                return await asyncio.wait_for(future, timeout=self.timeout_s)
+        except asyncio.TimeoutError:
+            self._metrics.incr("server_timeout")
+            raise HttpError(504, f"inference did not finish within {self.timeout_s:g}s")
+
+    async def _route(self, method, target, body):
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        if url.path == "/healthz":
+            return 200, {"status": "ok"}
+        if url.path == "/readyz":
+            error = self._models.warmup_error()
+            ready = self._models.ready()
+            status = 200 if ready else 503
+            return status, {"ready": ready, "queued": self._queue.qsize(),
+                            "error": str(error) if error else None,
+                            "startup": self._models.startup_report()}
+        if url.path == "/metrics":
+            if query.get("format", [""])[0] == "json":
+                return 200, self._metrics.snapshot()
+            return 200, self._metrics.to_prometheus()
+        if url.path == "/classify":
+            if method != "POST":
+                raise HttpError(405, "use POST")
+            return 200, await self._classify(query, body)
+        raise HttpError(404, f"no route for {url.path}")
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "malformed request line"}, keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                keep_alive = (headers.get("connection", "").lower() != "close"
+                              and version.upper() == "HTTP/1.1")
+                try:
+                    length = int(headers.get("content-length", "0") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._respond(writer, 400, {"error": "invalid Content-Length"}, keep_alive=False)
+                    break
+                if length > self.max_body:
+                    await self._respond(writer, 413, {"error": "image too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                try:
+                    status, payload = await self._route(method.upper(), target, body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    logger.exception("request failed")
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive=True):
+        if isinstance(payload, str):
+            body = payload.encode()
+            content_type = "text/plain; version=0.0.4"
+        else:
+            body = json.dumps(payload, default=json_default).encode()
+            content_type = "application/json"
+        headers = [
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status in (429, 503):
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the armrest classifier over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="concurrent inferences")
+    parser.add_argument("--queue-size", type=int, default=16, help="requests allowed to wait before 429")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--max-body-mb", type=float, default=25)
+    parser.add_argument("--no-batch-precheck", action="store_true",
+                        help="don't coalesce concurrent YOLO prechecks into batched predicts")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    server = InferenceServer(args.host, args.port, workers=args.workers, queue_size=args.queue_size,
+                             timeout_s=args.timeout, max_body_mb=args.max_body_mb,
+                             batch_precheck=not args.no_batch_precheck)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
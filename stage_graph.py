@@ -0,0 +1,85 @@
+"""Tiny dependency-graph executor for the per-image pipeline stages.
+
+Each stage is a callable that receives the results of the stages it depends
+on, in the order they were declared. Stages whose dependencies are all
+finished are submitted to a thread pool together, so independent stages
+overlap. In process_image_flow pose depends on the precheck (it runs on the
+person box, and not at all without a person), so only the armrest search and
+the landmark annotation run side by side.
+
+    graph = StageGraph()
+    graph.add("precheck", lambda: precheck_frame(frame))
+    graph.add("pose", lambda env: detect_arm_landmarks(frame, person_box=...), deps=("precheck",))
+    graph.add("arm_annotation", lambda lm: ..., deps=("pose",))
+    graph.add("armrest", lambda env, lm: ..., deps=("precheck", "pose"))
+    results = graph.run(executor)
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+
+class InlineExecutor:
+    """Runs each submitted stage immediately in the calling thread.
+
+    Used when a request is profiled, since cProfile only sees its own thread.
+    """
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class StageGraph:
+    def __init__(self):
+        self._stages = {}
+
+    def add(self, name, fn, deps=()):
+        if name in self._stages:
+            raise ValueError(f"stage {name!r} already defined")
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"stage {name!r} depends on unknown stage {dep!r}")
+        self._stages[name] = (fn, tuple(deps))
+        return self
+
+    def run(self, executor=None):
+        """Run every stage and return a dict of stage name -> result.
+
+        The first stage exception is re-raised after cancelling stages that
+        have not started yet.
+        """
+        return dict(self.iter_run(executor))
+
+    def iter_run(self, executor=None):
+        """Like run(), but yield (name, result) as each stage finishes."""
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=max(1, len(self._stages)))
+        results = {}
+        waiting = dict(self._stages)
+        running = {}
+        try:
+            while waiting or running:
+                ready = [name for name, (_, deps) in waiting.items() if all(d in results for d in deps)]
+                for name in ready:
+                    fn, deps = waiting.pop(name)
+                    running[executor.submit(fn, *[results[d] for d in deps])] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+                    yield name, results[name]
+        except BaseException:
+            # Also reached when the consumer stops iterating (GeneratorExit)
+            for future in running:
+                future.cancel()
+            raise
+        finally:
+            if own_executor:
+                executor.shutdown(wait=False)
@@ -0,0 +1,246 @@
+"""Continuous posture monitoring from a video file or camera.
+
+Unlike process_image_flow, which treats every image on its own, the stream
+processor carries state between frames:
+
+* MediaPipe runs in tracking mode (static_image_mode=False), so landmarks are
+  tracked from the previous frame instead of re-detected.
+* The YOLO precheck runs every `precheck_every` frames, or sooner when a
+  32x32 thumbnail of the frame differs enough from the last checked one.
+* The armrest line found by the Canny/Hough search is followed from frame to
+  frame with a cheap row-gradient check in a narrow band around its last
+  position; the full search only reruns when tracking loses it, the elbow
+  moves a lot, or every `redetect_every` frames.
+* The per-frame classification is smoothed by a majority vote over a window.
+
+    python streaming.py 0                         # first webcam
+    python streaming.py desk_cam.mp4 --out posture.jsonl
+"""
+import argparse
+import json
+import sys
+import time
+from collections import Counter, deque
+
+import cv2
+import numpy as np
+
+from arm_detection import armrest_line_strength, detect_arm_landmarks, desk_band, search_armrest
+from classify import classify_armrest_height
+from env_analysis import build_json, get_posture, run_precheck
+from image_handler import scale_box, scale_landmarks, scene_signature, to_working_resolution
+from metrics import metrics
+from pose_pool import create_pose
+
+STREAM_MAX_SIDE = 640
+PRECHECK_EVERY = 30
+SCENE_CHANGE_THRESHOLD = 12.0     # mean abs difference of 32x32 gray thumbnails (0-255)
+ARMREST_REDETECT_EVERY = 90
+ARMREST_TRACK_BAND = 0.15         # search band around the last armrest line, times upper arm length
+ARMREST_MIN_STRENGTH = 0.5        # tracked edge must keep this share of its strength at detection
+ELBOW_JUMP = 0.5                  # elbow moving more than this times the upper arm forces a re-detect
+SMOOTHING_WINDOW = 15
+
+
+def read_frames(source, max_side=STREAM_MAX_SIDE):
+    """Yield (index, timestamp_s, working_frame, scale) from a video file or camera index."""
+    cap = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    if not cap.isOpened():
+        raise ValueError(f"could not open video source {source!r}")
+    start = time.monotonic()
+    index = 0
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                return
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0 or time.monotonic() - start
+            working, scale = to_working_resolution(frame, max_side)
+            yield index, timestamp, working, scale
+            index += 1
+    finally:
+        cap.release()
+
+
+def _upper_arm(landmarks):
+    shoulder, elbow = landmarks["shoulder"], landmarks["elbow"]
+    return max(1.0, float(np.hypot(shoulder["x"] - elbow["x"], shoulder["y"] - elbow["y"])))
+
+
+class ArmrestTracker:
+    """Follows the armrest line between frames instead of re-running Canny/Hough."""
+
+    def __init__(self, redetect_every=ARMREST_REDETECT_EVERY):
+        self.redetect_every = redetect_every
+        self.box = None
+        self._strength = 0.0
+        self._elbow = None
+        self._detected_at = None
+
+    def reset(self):
+        self.box = None
+        self._detected_at = None
+
+    def update(self, frame, landmarks, frame_index):
+        upper_arm = _upper_arm(landmarks)
+        elbow = landmarks["elbow"]
+        due = (self._detected_at is None
+               or frame_index - self._detected_at >= self.redetect_every
+               or np.hypot(elbow["x"] - self._elbow["x"], elbow["y"] - self._elbow["y"]) > ELBOW_JUMP * upper_arm)
+        band = max(3, int(upper_arm * ARMREST_TRACK_BAND))
+        if not due and self.box is None:
+            # The last search found no armrest (e.g. a chair without one); wait for the next re-detect
+            return None
+        if not due:
+            with metrics.span("armrest_track"):
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                row, strength = armrest_line_strength(gray, self.box, band)
+            if strength >= ARMREST_MIN_STRENGTH * self._strength:
+                self.box = {**self.box, "y": row - 5}
+                metrics.incr("armrest_tracked")
+                return self.box
+            metrics.incr("armrest_track_lost")
+
+        with metrics.span("armrest_detect"):
+            box = search_armrest(frame, landmarks)
+        self._detected_at = frame_index
+        self._elbow = dict(elbow)
+        if not box:
+            self.box = None
+            return None
+        self.box = box
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self._strength = armrest_line_strength(gray, box, band)[1]
+        return box
+
+
+class TemporalSmoother:
+    """Majority vote over the last `window` decisive classifications."""
+
+    def __init__(self, window=SMOOTHING_WINDOW):
+        self._labels = deque(maxlen=window)
+
+    def update(self, label):
+        self._labels.append(label)
+        decisive = [l for l in self._labels if l != "Insufficient Data"]
+        if not decisive:
+            return "Insufficient Data"
+        return Counter(decisive).most_common(1)[0][0]
+
+
+class StreamProcessor:
+    def __init__(self, precheck_every=PRECHECK_EVERY, scene_change_threshold=SCENE_CHANGE_THRESHOLD,
+                 redetect_every=ARMREST_REDETECT_EVERY, smoothing_window=SMOOTHING_WINDOW, pose=None,
+                 model_complexity=0):
+        self.precheck_every = precheck_every
+        self.scene_change_threshold = scene_change_threshold
+        self.pose = pose or create_pose(model_complexity=model_complexity, static_image_mode=False)
+        self.tracker = ArmrestTracker(redetect_every)
+        self.smoother = TemporalSmoother(smoothing_window)
+        self._env_json = None
+        self._signature = None
+        self._checked_at = None
+
+    def _precheck_due(self, frame, frame_index):
+        if self._env_json is None or frame_index - self._checked_at >= self.precheck_every:
+            return True
+        diff = np.abs(scene_signature(frame) - self._signature).mean()
+        return diff > self.scene_change_threshold
+
+    def process(self, frame, frame_index):
+        """Analyze one working-resolution frame; coordinates are in that frame."""
+        prechecked = self._precheck_due(frame, frame_index)
+        if prechecked:
+            _, _, _, detected_labels = run_precheck(frame)
+            self._env_json = build_json(detected_labels, get_posture(detected_labels))
+            self._signature = scene_signature(frame)
+            self._checked_at = frame_index
+        env_json = self._env_json
+
+        landmarks = detect_arm_landmarks(frame, pool=self.pose)
+        if not landmarks:
+            self.tracker.reset()
+            result_json = {**env_json, "arm_landmarks_detected": False}
+        else:
+            armrest_box = {}
+            if env_json.get("isChair"):
+                armrest_box = self.tracker.update(frame, landmarks, frame_index) or {}
+            desk_y = desk_band(landmarks, frame.shape)[1] if env_json.get("isDesk") else -1
+            result_json = {
+                **env_json,
+                "arm_landmarks_detected": True,
+                "landmarks": landmarks,
+                "armrest_box": armrest_box,
+                "desk_y": desk_y,
+            }
+        classification = classify_armrest_height(result_json)
+        return {
+            "prechecked": prechecked,
+            "classification": classification,
+            "smoothed_classification": self.smoother.update(classification),
+            "result": result_json,
+        }
+
+    def close(self):
+        self.pose.close()
+
+
+def monitor(source, max_side=STREAM_MAX_SIDE, max_frames=None, **processor_kwargs):
+    """Yield one result dict per frame of `source`, in source-resolution coordinates."""
+    processor = StreamProcessor(**processor_kwargs)
+    try:
+        for index, timestamp, frame, scale in read_frames(source, max_side):
+            if max_frames is not None and index >= max_frames:
+                return
+            start = time.perf_counter()
+            out = processor.process(frame, index)
+            result = out["result"]
+            if result.get("arm_landmarks_detected"):
+                result["landmarks"] = scale_landmarks(result["landmarks"], scale)
+                result["armrest_box"] = scale_box(result["armrest_box"], scale)
+                if result["desk_y"] >= 0:
+                    result["desk_y"] = int(round(result["desk_y"] * scale))
+            out["frame"] = index
+            out["timestamp_s"] = round(timestamp, 3)
+            out["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            yield out
+    finally:
+        processor.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monitor armrest posture from a video file or camera.")
+    parser.add_argument("source", help="video file path or camera index (e.g. 0)")
+    parser.add_argument("--out", help="write one JSON line per frame here (default: stdout)")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--max-side", type=int, default=STREAM_MAX_SIDE)
+    parser.add_argument("--precheck-every", type=int, default=PRECHECK_EVERY)
+    parser.add_argument("--scene-change", type=float, default=SCENE_CHANGE_THRESHOLD)
+    parser.add_argument("--redetect-every", type=int, default=ARMREST_REDETECT_EVERY)
+    parser.add_argument("--smoothing-window", type=int, default=SMOOTHING_WINDOW)
+    parser.add_argument("--model-complexity", type=int, default=0, choices=(0, 1, 2))
+    args = parser.parse_args(argv)
+
+    out = open(args.out, "w") if args.out else sys.stdout
+    frames = 0
+    start = time.perf_counter()
+    try:
+        for result in monitor(args.source, max_side=args.max_side, max_frames=args.max_frames,
+                              precheck_every=args.precheck_every, scene_change_threshold=args.scene_change,
+                              redetect_every=args.redetect_every, smoothing_window=args.smoothing_window,
+                              model_complexity=args.model_complexity):
+            out.write(json.dumps(result) + "\n")
+            frames += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    if frames:
+        print(f"{frames} frames in {elapsed:.1f}s ({frames / elapsed:.1f} FPS)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,101 +1,137 @@
 import streamlit as st
+import hashlib
 import re
-import matplotlib.pyplot as plt
-from PIL import Image
-import os
-from flow import process_image_flow
-from classify import classify_armrest_height
+import uuid
+import models
+from annotation import Annotation
+from flow import (iter_process_image_flow, EnvEvent, LandmarksEvent, ArmrestEvent, ClassificationEvent,
+                  ArtifactsEvent, ResultEvent)
+from image_handler import decode_image, get_artifact_store
+
+
+@st.cache_resource
+def start_model_warmup():
+    # Runs once per server process: models load in the background while the
+    # page renders, and script reruns never reload them.
+    return models.warmup(background=True)
+
+
+# The page is at most ~700px wide, so annotations are rendered no larger than this
+PREVIEW_MAX_SIDE = 1024
+
+
+def show_image(placeholder, img, caption=None):
+    # Annotations are rendered here, at preview size; artifacts are BGR or single-channel arrays
+    if isinstance(img, Annotation):
+        img = img.render(PREVIEW_MAX_SIDE)
+    if img.ndim == 3:
+        placeholder.image(img, caption=caption, channels="BGR", use_container_width=True)
+    else:
+        placeholder.image(img, caption=caption, use_container_width=True)
+
+
+def show_intermediate_results(request_id):
+    """ROI gallery, read straight from the in-memory artifact store."""
+    artifacts = get_artifact_store().get(request_id)
+    artifact_names = artifacts.names() if artifacts is not None else []
+
+    # Artifact names look like <prefix>_<x>_<y>, e.g. candidate_canny_353_442
+    pattern = re.compile(r"^([a-z_]+)_(\d+)_(\d+)$")
+
+    images_by_suffix = {}
+    for name in artifact_names:
+        match = pattern.match(name)
+        if match:
+            prefix, x, y = match.groups()     # e.g. cropped, candidate_canny
+            # Only the ROI crops are fetched; the full-frame annotations are never rendered here
+            images_by_suffix.setdefault(f"{x}_{y}", {})[prefix] = artifacts.get(name)
+
+    if not images_by_suffix:
+        st.info("No intermediate images were recorded for this image.")
+        return
+    st.markdown("Region of interest processing for above and below elbow")
+
+    # Order to display prefixes
+    display_order = ["cropped", "candidate_canny", "candidate_mask", "candidates"]
+    for images_dict in images_by_suffix.values():
+        for col, prefix in zip(st.columns(len(display_order)), display_order):
+            if prefix in images_dict:
+                show_image(col, images_dict[prefix], caption=prefix)
+            else:
+                col.caption(prefix + " (Not found)")
+
+
+def analyze(image, name):
+    """Run the pipeline, rendering each stage's result as soon as it arrives."""
+    header = st.empty()
+    header.header("Analyzing image...")
+    annotated_slot = st.empty()
+    st.header("Detection JSON")
+    json_slot = st.empty()
+
+    request_id = uuid.uuid4().hex
+    analysis = {"request_id": request_id}
+    for event in iter_process_image_flow(image, name, request_id=request_id):
+        if isinstance(event, EnvEvent):
+            header.header("Environment detected - locating arm...")
+            show_image(annotated_slot, event.annotated)
+            json_slot.json(event.result)
+        elif isinstance(event, LandmarksEvent):
+            header.header("Arm located - searching for the armrest...")
+            show_image(annotated_slot, event.annotated)
+        elif isinstance(event, ArmrestEvent):
+            show_image(annotated_slot, event.annotated)
+        elif isinstance(event, ClassificationEvent):
+            analysis["classification"] = event.label
+            header.header("Armrest Assessment - " + event.label)
+        elif isinstance(event, ArtifactsEvent):
+            analysis["artifacts"] = event.names
+        elif isinstance(event, ResultEvent):
+            analysis["annotated"], analysis["result"] = event.annotated, event.result
+            show_image(annotated_slot, event.annotated)
+            json_slot.json(event.result)
+    return analysis
+
+
+def show_analysis(analysis):
+    st.header("Armrest Assessment - " + analysis["classification"])
+    show_image(st, analysis["annotated"])
+    st.header("Detection JSON")
+    st.json(analysis["result"])
+
 
 st.set_page_config(page_title="Armrest Height Classification", layout="centered")
+start_model_warmup()
 st.title("Ergonomic Armrest Height Classifier")
 st.markdown("Upload a side-profile image of a person working at their desk.")
 st.markdown("Accepted image formats: .png, .jpg, .jpeg, .webp")
 
 uploaded_file = st.file_uploader(
-    "Upload a side-profile image", 
+    "Upload a side-profile image",
     type=['png', 'jpg', 'jpeg', 'webp']
 )
 
 if uploaded_file:
     try:
-        image = Image.open(uploaded_file).convert("RGB")
-        st.image(image, caption="Uploaded Image", use_container_width=True)
-
-        with st.spinner("Analyzing image..."):
-            annotated_img, result_json = process_image_flow(image, uploaded_file.name)
-
-        st.header("Armrest Assessment - " + classify_armrest_height(result_json))
-        st.image(annotated_img, use_container_width=True)
-        st.header("Detection JSON")
-        st.json(result_json)
-
-
-
-
-
-       
-        # New part: show intermediate images grouped by suffix
-
-        intermediate_dir = "intermediate_images"
-        all_files = os.listdir(intermediate_dir)
-
-        # Extract suffix pattern and group by it
-        # Example filename: s4_cropped_353_442.png
-        pattern = re.compile(r"^(?:[^_]+)_([a-z_]+)_(\d+_\d+)\.png$")
-
-        # We want to group by suffix (the x_y part) and then sort by the prefixes in order
-        # But the naming has a prefix part before x_y, like 'cropped', 'candidate_canny', etc.
-        # Actually the pattern above does not separate the prefix correctly, we want to separate the
-        # prefix and suffix properly:
-        # Format looks like s4_<prefix>_<x>_<y>.png
-        # So let's parse as: s4_<prefix>_<x>_<y>.png
-
-        # Let's do better regex:
-        pattern = re.compile(r"^(?:[^_]+)_([a-z_]+)_(\d+)_(\d+)\.png$")
-
-        images_by_suffix = {}
-
-        for fname in all_files:
-            match = pattern.match(fname)
-            if match:
-                prefix = match.group(1)          # e.g. cropped, candidate_canny
-                x = match.group(2)
-                y = match.group(3)
-                suffix = f"{x}_{y}"              # group by this
-                if suffix not in images_by_suffix:
-                    images_by_suffix[suffix] = {}
-                images_by_suffix[suffix][prefix] = os.path.join(intermediate_dir, fname)
-
-        # Order to display prefixes
-        display_order = ["cropped", "candidate_canny", "candidate_mask", "candidates"]
-        if images_by_suffix and len(images_by_suffix) > 0:
+        # Decoded straight to a BGR frame at working resolution, upright per EXIF
+        data = uploaded_file.getvalue()
+        image = decode_image(data)
+        st.image(image.frame, caption="Uploaded Image", channels="BGR", use_container_width=True)
+
+        # Keep the analysis across reruns (e.g. opening the gallery) of the same upload
+        upload_key = hashlib.sha256(data).hexdigest()
+        analysis = st.session_state.get("analysis")
+        if analysis is None or analysis["upload"] != upload_key:
+            analysis = analyze(image, uploaded_file.name)
+            analysis["upload"] = upload_key
+            st.session_state["analysis"] = analysis
+        else:
+            show_analysis(analysis)
+
+        # Built only on request; the images are already in memory
+        if analysis.get("artifacts") and st.toggle("Show intermediate results"):
             st.header("Intermediate Results")
-            st.markdown("Region of interest processing for above and below elbow")
-
-        # Now display each suffix group in one line with subplots
-        for suffix, images_dict in images_by_suffix.items():
-            fig, axes = plt.subplots(1, len(display_order), figsize=(15, 4))
-            if len(display_order) == 1:
-                axes = [axes]  # make iterable if only 1 subplot
-            for ax, prefix in zip(axes, display_order):
-                ax.axis('off')
-                if prefix in images_dict:
-                    img_path = images_dict[prefix]
-                    img = Image.open(img_path)
-                    ax.imshow(img)
-                    ax.set_title(prefix)
-                else:
-                    ax.set_title(prefix + "\n(Not found)")
-            st.pyplot(fig)
-
-    except Exception as e:
-        st.error(f"Error processing image: {e}")
-
-
-
- 
-
-
+            show_intermediate_results(analysis["request_id"])
 
     except Exception as e:
         st.error(f"Error processing image: {e}")
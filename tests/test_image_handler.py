@@ -0,0 +1,52 @@
+import threading
+
+import numpy as np
+
+from image_handler import ArtifactStore
+
+MB = 1024 * 1024
+
+
+def _image():
+    return np.zeros(MB, dtype=np.uint8)
+
+
+def _counted(store):
+    return sum(artifacts.nbytes for artifacts in store._requests.values())
+
+
+def test_eviction_during_write_keeps_accounting_exact():
+    # Room for one request's two images, not for a second request on top
+    store = ArtifactStore(mode="memory", budget_mb=2.5)
+    a = store.begin("a")
+    a.put(_image(), "a.jpg", "first")
+    b = store.begin("b")
+
+    real_added = store._added
+    racer = []
+
+    def added(artifacts, delta):
+        if artifacts is a and not racer:
+            # Another request writes while `a` is between recording its image and accounting for it
+            racer.append(threading.Thread(target=b.put, args=(_image(), "b.jpg", "first")))
+            racer.append(threading.Thread(target=b.put, args=(_image(), "b.jpg", "second")))
+            for thread in racer:
+                thread.start()
+                thread.join(0.2)
+        real_added(artifacts, delta)
+
+    store._added = added
+    a.put(_image(), "a.jpg", "second")
+    for thread in racer:
+        thread.join()
+
+    assert store.get("a") is None
+    assert store.nbytes == _counted(store) == 2 * MB
+
+
+def test_budget_evicts_least_recently_used_request():
+    store = ArtifactStore(mode="memory", budget_mb=2.5)
+    for request_id in ("a", "b", "c"):
+        store.begin(request_id).put(_image(), f"{request_id}.jpg", "first")
+    assert store.get("a") is None
+    assert store.nbytes == _counted(store) == 2 * MB
@@ -0,0 +1,42 @@
+import pytest
+
+import benchmark
+from benchmark import SCENE, StandInPose, install_stand_in_detector, make_scene
+from image_handler import DecodedImage, configure_artifact_store
+from pose_pool import configure_pose_pool
+from scene_cache import SceneCache, process_snapshot
+
+WIDTH, HEIGHT = 640, 480
+
+
+@pytest.fixture(autouse=True)
+def stand_in_models():
+    install_stand_in_detector()
+    configure_pose_pool(size=1, factory=StandInPose)
+    configure_artifact_store("off")
+
+
+def _snapshot(cache):
+    frame = make_scene(WIDTH, HEIGHT)
+    return process_snapshot(DecodedImage(frame, 1.0), "desk-1", cache=cache)[1]
+
+
+def test_unchanged_scene_reuses_cached_armrest():
+    cache = SceneCache()
+    first = _snapshot(cache)
+    second = _snapshot(cache)
+    assert first["armrest_box"]
+    assert not first["scene_cache_hit"] and second["scene_cache_hit"]
+    assert second["armrest_box"]["y"] == first["armrest_box"]["y"]
+
+
+def test_moved_armrest_is_searched_again(monkeypatch):
+    cache = SceneCache()
+    first = _snapshot(cache)
+    assert abs(first["armrest_box"]["y"] - SCENE["armrest_y"] * HEIGHT) < 15
+
+    # Raise the armrest; it lies inside the masked person region, so the scene signature stays the same
+    monkeypatch.setitem(benchmark.SCENE, "armrest_y", 0.46)
+    second = _snapshot(cache)
+    assert second["scene_cache_hit"]
+    assert abs(second["armrest_box"]["y"] - 0.46 * HEIGHT) < 15